@@ -0,0 +1,75 @@
+"""Deadline budgets for request pipelines.
+
+A Deadline is created once per request and passed down to every upstream call,
+which gets a timeout taken from whatever budget is left. Calls run on a shared
+pool so a slow call can be abandoned when its timeout passes; the abandoned call
+finishes in the background, so upstream clients should also be given the same
+timeout where they support one.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Optional
+
+from profiling import traced
+
+call_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="deadline-call")
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Seconds a call may take: the remaining budget, limited to cap"""
+        remaining = self.remaining()
+        return min(remaining, cap) if cap else remaining
+
+
+def call_with_deadline(fn: Callable, *args, deadline: Optional[Deadline] = None, cap: Optional[float] = None,
+                       hedge_after: Optional[float] = None, **kwargs):
+    """Call fn(*args, **kwargs), giving up with DeadlineExceeded once its timeout passes.
+
+    The timeout is the deadline's remaining budget limited to cap. With hedge_after,
+    a second identical call is started if the first has not returned by then and the
+    first successful result wins, which cuts the tail added by one slow upstream call.
+    """
+    if deadline is None and cap is None and not hedge_after:
+        return fn(*args, **kwargs)
+
+    timeout = deadline.timeout(cap) if deadline else cap
+    if timeout is not None and timeout <= 0:
+        raise DeadlineExceeded(f"no time left for {getattr(fn, '__name__', 'call')}")
+
+    started = time.monotonic()
+    fn = traced(fn)
+    futures = [call_pool.submit(fn, *args, **kwargs)]
+    if hedge_after and (timeout is None or hedge_after < timeout):
+        done, _ = wait(futures, timeout=hedge_after)
+        if not done or futures[0].exception() is not None:
+            # First attempt is slow or already failed: race a second one against it
+            futures.append(call_pool.submit(fn, *args, **kwargs))
+
+    error = None
+    pending = set(futures)
+    while pending:
+        wait_for = None if timeout is None else timeout - (time.monotonic() - started)
+        if wait_for is not None and wait_for <= 0:
+            raise DeadlineExceeded(f"{getattr(fn, '__name__', 'call')} timed out after {timeout:.1f}s")
+
+        done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+
+    raise error
@@ -0,0 +1,97 @@
+"""Decoding of Gemini function-call results.
+
+Function-call args arrive as loosely typed dicts. decode() validates them against
+the pydantic model the function was declared from, which coerces what it can
+(e.g. "true" to True, ISO datetimes with seconds or offsets) and fails with a
+short, model-readable error otherwise, so the caller can re-ask for just that
+email. Pydantic builds each model's validator once, when the class is defined.
+
+Event times are normalized to EVENT_TIME_FORMAT, the format the rest of the
+app reads.
+"""
+from datetime import date, datetime
+from typing import Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+EVENT_TIME_FORMAT = "%Y-%m-%d %H:%M"
+# Formats pydantic does not read itself but models still produce now and then
+EXTRA_TIME_FORMATS = ("%Y-%m-%d %I:%M %p", "%Y/%m/%d %H:%M", "%Y-%m-%d %H.%M")
+
+
+class DecodeError(ValueError):
+    """Function-call output that is missing or does not match its schema"""
+
+    def __init__(self, message: str, called: bool = True):
+        super().__init__(message)
+        self.called = called  # False when the model did not call the function at all
+
+
+def is_date_only(text: str) -> bool:
+    try:
+        date.fromisoformat(text)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_event_time(value) -> datetime:
+    """Naive datetime from any accepted event time format. Offsets are dropped, the wall clock time is kept.
+
+    A date without a time is rejected rather than read as midnight, so the model is asked for the time.
+    """
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        text = str(value).strip()
+        if is_date_only(text):
+            raise ValueError(f"expected date and time as YYYY-MM-DD HH:MM, got a date without a time {text!r}")
+        try:
+            parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+        except ValueError:
+            for fmt in EXTRA_TIME_FORMATS:
+                try:
+                    parsed = datetime.strptime(text.upper(), fmt)
+                    break
+                except ValueError:
+                    continue
+            else:
+                raise ValueError(f"expected date and time as YYYY-MM-DD HH:MM, got {text!r}")
+    return parsed.replace(tzinfo=None, second=0, microsecond=0)
+
+
+def format_event_time(value) -> str:
+    return parse_event_time(value).strftime(EVENT_TIME_FORMAT)
+
+
+def function_args(response, function_name: str) -> Dict:
+    """Args of the first call to function_name in a Gemini response"""
+    candidates = response.candidates or []
+    if candidates and candidates[0].content and candidates[0].content.parts:
+        for part in candidates[0].content.parts:
+            function_call = getattr(part, 'function_call', None)
+            if function_call and function_call.name == function_name:
+                return dict(function_call.args or {})
+    raise DecodeError(f"No {function_name} call in the response, call {function_name} with the result", called=False)
+
+
+def error_feedback(error: ValidationError) -> str:
+    """One line per failing field, short enough to send back to the model"""
+    lines = []
+    for item in error.errors(include_url=False, include_context=False):
+        field = '.'.join(str(part) for part in item['loc']) or 'arguments'
+        if item['type'] == 'missing':
+            lines.append(f"{field}: required")
+        elif item['type'] == 'value_error':
+            lines.append(f"{field}: {item['msg'].removeprefix('Value error, ')}")
+        else:
+            lines.append(f"{field}: {item['msg']} (got {item.get('input')!r})")
+    return "\n".join(lines)
+
+
+def decode(model: Type[BaseModel], args: Optional[Dict]) -> Dict:
+    """Validated, normalized args as a plain dict, or DecodeError"""
+    try:
+        return model.model_validate(args or {}).model_dump()
+    except ValidationError as e:
+        raise DecodeError(error_feedback(e)) from e
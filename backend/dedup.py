@@ -0,0 +1,128 @@
+"""Near-duplicate detection for mail that lands in many inboxes.
+
+Emails are reduced to a 64-bit SimHash over word shingles of their normalized
+text. Fingerprints are split into eight 8-bit bands, so any two fingerprints
+within seven bits of each other share at least one band and a band lookup
+finds every candidate.
+
+Numbers are part of the shingles, and a match also needs the exact same
+sequence of numbers and capitalized words outside the greeting, so mails that
+differ only in a date, time, amount, order number, name or address are never
+treated as duplicates.
+"""
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+SIMHASH_BITS = 64
+BAND_BITS = 8
+BAND_COUNT = SIMHASH_BITS // BAND_BITS
+MAX_INDEXED_DISTANCE = BAND_COUNT - 1
+SHINGLE_SIZE = 3
+MIN_TOKENS = 20  # shorter emails are too easy to confuse
+
+GREETING_PATTERN = re.compile(r'^\s*(hi|hello|hey|dear)\b[^\n]*$', re.IGNORECASE | re.MULTILINE)
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+EMAIL_PATTERN = re.compile(r'\S+@\S+')
+TOKEN_PATTERN = re.compile(r'[a-z]{2,}|\d+')
+# Numbers and capitalized words, which carry names, places and amounts
+EXACT_TOKEN_PATTERN = re.compile(r'\d+|\b[A-Z][A-Za-z\'-]*')
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_fingerprints (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fingerprint TEXT NOT NULL,
+            band0 INTEGER NOT NULL,
+            band1 INTEGER NOT NULL,
+            band2 INTEGER NOT NULL,
+            band3 INTEGER NOT NULL,
+            band4 INTEGER NOT NULL,
+            band5 INTEGER NOT NULL,
+            band6 INTEGER NOT NULL,
+            band7 INTEGER NOT NULL,
+            signature TEXT,
+            ai_result TEXT NOT NULL,
+            hits INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    # Fingerprints stored before the signature existed have none and are never matched
+    cursor.execute("PRAGMA table_info(email_fingerprints)")
+    if 'signature' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE email_fingerprints ADD COLUMN signature TEXT")
+    for band in range(BAND_COUNT):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_email_fingerprints_band{band} ON email_fingerprints (band{band})")
+
+
+def strip_text(text: str) -> str:
+    """Text with greetings, links and addresses removed"""
+    text = GREETING_PATTERN.sub(' ', text)
+    text = URL_PATTERN.sub(' ', text)
+    return EMAIL_PATTERN.sub(' ', text)
+
+
+def normalize_text(text: str) -> List[str]:
+    """Lowercase word and number tokens with greetings, links and addresses removed"""
+    return TOKEN_PATTERN.findall(strip_text(text).lower())
+
+
+def exact_signature(text: str) -> str:
+    """Hash of the numbers and capitalized words in the email, in order, greeting left out"""
+    tokens = EXACT_TOKEN_PATTERN.findall(strip_text(text))
+    return hashlib.blake2b(" ".join(tokens).encode(), digest_size=8).hexdigest()
+
+
+def simhash(text: str) -> Optional[int]:
+    """64-bit SimHash of the email text, or None when it is too short to fingerprint"""
+    tokens = normalize_text(text)
+    if len(tokens) < MIN_TOKENS:
+        return None
+
+    weights = [0] * SIMHASH_BITS
+    for i in range(len(tokens) - SHINGLE_SIZE + 1):
+        shingle = " ".join(tokens[i:i + SHINGLE_SIZE]).encode()
+        value = int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def split_bands(fingerprint: int) -> List[int]:
+    mask = (1 << BAND_BITS) - 1
+    return [fingerprint >> (band * BAND_BITS) & mask for band in range(BAND_COUNT)]
+
+
+def find_near_duplicate(cursor, fingerprint: int, signature: str, max_distance: int, max_age_hours: int) -> Optional[Dict]:
+    """Closest stored fingerprint within max_distance bits with the same exact signature, as {'id', 'ai_result', 'distance'}"""
+    max_distance = min(max_distance, MAX_INDEXED_DISTANCE)
+    bands = split_bands(fingerprint)
+    cursor.execute(f"""
+        SELECT id, fingerprint, ai_result FROM email_fingerprints
+        WHERE ({' OR '.join(f'band{band} = ?' for band in range(BAND_COUNT))})
+        AND signature = ? AND created_at >= datetime('now', ?)
+    """, (*bands, signature, f'-{max_age_hours} hours'))
+
+    best = None
+    for row in cursor.fetchall():
+        distance = hamming_distance(fingerprint, int(row[1], 16))
+        if distance <= max_distance and (best is None or distance < best['distance']):
+            best = {'id': row[0], 'ai_result': row[2], 'distance': distance}
+    return best
+
+
+def store_fingerprint(cursor, fingerprint: int, signature: str, ai_result: str):
+    cursor.execute(f"""
+        INSERT INTO email_fingerprints (fingerprint, {', '.join(f'band{band}' for band in range(BAND_COUNT))}, signature, ai_result)
+        VALUES ({', '.join('?' for _ in range(BAND_COUNT + 3))})
+    """, (f'{fingerprint:016x}', *split_bands(fingerprint), signature, ai_result))
+
+
+def record_hit(cursor, fingerprint_id: int):
+    cursor.execute("UPDATE email_fingerprints SET hits = hits + 1 WHERE id = ?", (fingerprint_id,))
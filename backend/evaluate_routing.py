@@ -0,0 +1,90 @@
+"""Compare model routing configs offline on a set of sample emails.
+
+Runs every sample through categorize_and_summarize_email once per routing config
+and prints, per config, calls, re-asks, tokens and latency for each stage and
+model, plus label accuracy for samples that carry expected labels:
+
+    python evaluate_routing.py samples.jsonl routes_a.json routes_b.json [--default]
+
+Samples are JSON lines with "text" and optionally "importance" and "category".
+Route files use the MODEL_ROUTES_FILE format (see routing.py). Usage is recorded
+in a throwaway database, so the app's model_usage table is not touched.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import routing
+
+
+def load_samples(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def accuracy(samples, results, label):
+    labelled = [(sample[label], result[label]) for sample, result in zip(samples, results) if label in sample]
+    if not labelled:
+        return None
+    return sum(expected == actual for expected, actual in labelled) / len(labelled)
+
+
+def print_report(name, samples, results, usage, elapsed):
+    print(f"\n== {name} ==")
+    print(f"{'stage':<18}{'model':<26}{'calls':>7}{'ok':>6}{'invalid':>9}{'errors':>8}{'unused':>8}{'reasks':>8}{'fixed':>7}{'prompt tok':>12}{'output tok':>12}{'avg ms':>9}")
+    for row in usage:
+        print(f"{row['stage']:<18}{row['model']:<26}{row['calls']:>7}{row['ok']:>6}{row['invalid']:>9}{row['errors']:>8}{row['unused']:>8}"
+              f"{row['reasks']:>8}{row['reasks_fixed']:>7}"
+              f"{row['prompt_tokens']:>12,}{row['output_tokens']:>12,}{row['avg_latency_ms']:>9.0f}")
+
+    tokens = sum(row['prompt_tokens'] + row['output_tokens'] for row in usage)
+    failed = sum(1 for result in results if result.get('error'))
+    print(f"emails: {len(samples)}  failed: {failed}  tokens/email: {tokens / len(samples):,.0f}  "
+          f"wall time/email: {elapsed / len(samples) * 1000:,.0f} ms")
+    for label in ('importance', 'category'):
+        score = accuracy(samples, results, label)
+        if score is not None:
+            print(f"{label} accuracy: {score:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Gemini routing configs on sample emails")
+    parser.add_argument('samples')
+    parser.add_argument('configs', nargs='*', help="route files to compare")
+    parser.add_argument('--default', action='store_true', help="also run the default routes")
+    args = parser.parse_args()
+
+    paths = ([None] if args.default or not args.configs else []) + args.configs
+    # Load every config up front so a bad file fails before any tokens are spent
+    configs = [(path or 'default routes', routing.load_routes(path)) for path in paths]
+    samples = load_samples(args.samples)
+    if not samples:
+        raise SystemExit("No samples to evaluate")
+
+    # Must be set before main is imported, which initializes the database
+    database = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+    database.close()
+    os.environ['DATABASE_URL'] = database.name
+    import main as app
+
+    try:
+        for run, (name, routes) in enumerate(configs, start=1):
+            app.MODEL_ROUTES = routes
+            started = time.perf_counter()
+            # Each config records its usage under its own user id
+            results = [app.categorize_and_summarize_email(sample['text'], user_id=run) for sample in samples]
+            elapsed = time.perf_counter() - started
+
+            with app.get_db_connection() as conn:
+                usage = routing.usage_summary(conn.cursor(), run)
+            print_report(name, samples, results, usage, elapsed)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(database.name + suffix):
+                os.remove(database.name + suffix)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,59 +5,179 @@ from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from bs4 import BeautifulSoup
 
 
-tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y/%m/%d')
-yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y/%m/%d')
+PAGE_SIZE = 100  # messages.list allows up to 500 ids per page
+FETCH_WINDOW = 20  # message bodies fetched per batch request and held at once
 
+# Partial responses: only the fields the parsers below read. Part headers,
+# filenames, sizes and attachment bodies are never transferred; a text part
+# too large to be inlined is fetched through attachments.get when it is read.
+LIST_FIELDS = 'messages/id,nextPageToken'
+MESSAGE_FIELDS = 'internalDate,payload(mimeType,headers(name,value),body(data,attachmentId),parts(mimeType,body(data,attachmentId)))'
+HISTORY_FIELDS = 'history/messagesAdded/message(id,labelIds),nextPageToken'
+WATCH_FIELDS = 'historyId,expiration'
 
-def new_fetch(credentials: Credentials, email_count: int = 10):
-  #creds = get_creds()
+
+def inbox_query():
+  # Built per call so a long-running server keeps looking at the current days
+  tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y/%m/%d')
+  yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y/%m/%d')
+  return f'category:primary before:{tomorrow} after:{yesterday} is:unread'
+
+
+def iter_message_ids(credentials: Credentials, email_count: int = 10):
+  """Yield up to email_count inbox message ids, following nextPageToken page by page."""
   service = build("gmail", "v1", credentials=credentials)
+  query = inbox_query()
+  page_token = None
+  remaining = email_count
 
-  try:
+  while remaining > 0:
     results = (
-        service.users().messages().list(userId="me", 
+        service.users().messages().list(userId="me",
                                         labelIds=['INBOX'],
-                                        q=f'category:primary before:{tomorrow} after:{yesterday} is:unread', 
-                                        maxResults=email_count
+                                        q=query,
+                                        maxResults=min(remaining, PAGE_SIZE),
+                                        pageToken=page_token,
+                                        fields=LIST_FIELDS
                                         ).execute()
     )
-
     messages = results.get("messages", [])
+    for message in messages[:remaining]:
+      yield message['id']
+
+    remaining -= len(messages)
+    page_token = results.get("nextPageToken")
+    if not messages or not page_token:
+      break
+
+
+def list_message_ids(credentials: Credentials, email_count: int = 10):
+  return list(iter_message_ids(credentials, email_count))
+
+
+def parse_message(message_id, msg, fetch_attachment=None):
+  msg_json = get_text(msg, fetch_attachment)
+  msg_sender = msg_json.get('sender',"Unknown sender")
+  msg_text = msg_json.get('message',"")
+  msg_subject = msg_json.get('subject',"")
+  text = "\n".join(line.strip() for line in msg_text.splitlines() if line.strip())
+
+  bulk = is_bulk_mail(msg['payload'].get('headers', []))
+
+  received_at = None
+  if msg.get('internalDate'):
+    received_at = datetime.fromtimestamp(int(msg['internalDate']) / 1000, timezone.utc).isoformat()
+
+  return {'id':message_id,'sender':msg_sender,'subject':msg_subject, 'text':text, 'bulk':bulk, 'received_at':received_at}
+
+
+def iter_messages(credentials: Credentials, message_ids):
+  """Yield parsed messages lazily.
+
+  Ids are consumed FETCH_WINDOW at a time and each window is fetched in one batch
+  request, so at most one window of message bodies is in memory. Messages that
+  fail to fetch or parse are skipped.
+  """
+  service = build("gmail", "v1", credentials=credentials)
+  message_ids = iter(message_ids)
+
+  while True:
+    window = [message_id for _, message_id in zip(range(FETCH_WINDOW), message_ids)]
+    if not window:
+      return
+
+    fetched = {}
+
+    def collect(request_id, response, exception):
+      if exception is None:
+        fetched[request_id] = response
+
+    batch = service.new_batch_http_request(callback=collect)
+    for message_id in window:
+      batch.add(service.users().messages().get(userId="me", id=message_id, format='full', fields=MESSAGE_FIELDS), request_id=message_id)
+    batch.execute()
 
-    if not messages:
-        print("No messages found.")
-        return []
-
-    processed_messages = []
-
-    for message in messages:
-        try:
-          msg = (
-              service.users().messages().get(userId="me", id=message["id"], format='full').execute()
-          )
-
-          msg_json = get_text(msg)
-          msg_sender = msg_json.get('sender',"Unknown sender")
-          msg_text = msg_json.get('message',"")
-          msg_subject = msg_json.get('subject',"")
-          text = "\n".join(line.strip() for line in msg_text.splitlines() if line.strip())
-
-          processed_messages.append({'id':message['id'],'sender':msg_sender,'subject':msg_subject, 'text':text})
-        except Exception as e:
-           continue
-           
-    return processed_messages
+    for message_id in window:
+      msg = fetched.pop(message_id, None)
+      if msg is None:
+        continue
+      try:
+        yield parse_message(message_id, msg, lambda attachment_id: get_attachment_data(service, message_id, attachment_id))
+      except Exception as e:
+        continue
+
+
+def new_fetch(credentials: Credentials, email_count: int = 10):
+  #creds = get_creds()
+  try:
+    yield from iter_messages(credentials, iter_message_ids(credentials, email_count))
               
   except HttpError as error:
     # TODO(developer) - Handle errors from gmail API.
     print(f"An error occurred: {error}")
 
 
-def get_text(message):
+def watch_inbox(credentials: Credentials, topic_name: str):
+  """Start or renew Gmail push notifications for the inbox. Returns historyId and expiration."""
+  service = build("gmail", "v1", credentials=credentials)
+  return service.users().watch(userId="me", fields=WATCH_FIELDS, body={
+      'topicName': topic_name,
+      'labelIds': ['INBOX'],
+      'labelFilterBehavior': 'INCLUDE'
+  }).execute()
+
+
+NON_PRIMARY_LABELS = {'CATEGORY_PROMOTIONS', 'CATEGORY_SOCIAL', 'CATEGORY_UPDATES', 'CATEGORY_FORUMS'}
+
+
+def iter_added_message_ids(credentials: Credentials, start_history_id):
+  """Yield ids of unread primary inbox messages added after start_history_id."""
+  service = build("gmail", "v1", credentials=credentials)
+  page_token = None
+
+  while True:
+    results = (
+        service.users().history().list(userId="me",
+                                       startHistoryId=start_history_id,
+                                       historyTypes=['messageAdded'],
+                                       labelId='INBOX',
+                                       pageToken=page_token,
+                                       fields=HISTORY_FIELDS
+                                       ).execute()
+    )
+    for record in results.get('history', []):
+      for added in record.get('messagesAdded', []):
+        labels = set(added['message'].get('labelIds', []))
+        if 'UNREAD' in labels and not labels & NON_PRIMARY_LABELS:
+          yield added['message']['id']
+
+    page_token = results.get("nextPageToken")
+    if not page_token:
+      break
+
+
+def get_attachment_data(service, message_id, attachment_id):
+  return (
+      service.users().messages().attachments()
+      .get(userId="me", messageId=message_id, id=attachment_id, fields='data')
+      .execute()
+      .get('data', '')
+  )
+
+
+def body_data(body, fetch_attachment=None):
+  if 'data' in body:
+    return body['data']
+  if body.get('attachmentId') and fetch_attachment:
+    return fetch_attachment(body['attachmentId'])
+  return ''
+
+
+def get_text(message, fetch_attachment=None):
   payload = message['payload']
   headers = payload.get('headers', [])
 
@@ -67,20 +187,27 @@ def get_text(message):
   if payload.get('parts'):
       for part in payload['parts']:
         if part['mimeType'] == 'text/plain':
-          return {'sender':sender, 'subject':subject,'message':decode_base64(part['body']['data'])}
+          return {'sender':sender, 'subject':subject,'message':decode_base64(body_data(part['body'], fetch_attachment))}
         elif part['mimeType'] == 'text/html':
-          html = decode_base64(part['body']['data'])
+          html = decode_base64(body_data(part['body'], fetch_attachment))
           return {'sender':sender, 'subject':subject,'message':html_to_text(html)}
   else:
     if payload["mimeType"] == "text/plain":
-        return {'sender':sender, 'subject':subject,'message':decode_base64(payload["body"]["data"])}
+        return {'sender':sender, 'subject':subject,'message':decode_base64(body_data(payload["body"], fetch_attachment))}
     elif payload["mimeType"] == "text/html":
-        html = decode_base64(payload["body"]["data"])
+        html = decode_base64(body_data(payload["body"], fetch_attachment))
         return {'sender':sender, 'subject':subject,'message':html_to_text(html)}
     
   return {'sender': sender, 'subject':subject, 'message':''}
    
 
+def is_bulk_mail(headers):
+  # Mailing lists and newsletters announce themselves through these headers
+  names = {header['name'].lower(): header['value'] for header in headers}
+  if 'list-unsubscribe' in names or 'list-id' in names:
+    return True
+  return names.get('precedence', '').strip().lower() in ('bulk', 'list', 'junk')
+
 def decode_base64(data):
     return base64.urlsafe_b64decode(data).decode("utf-8")
 
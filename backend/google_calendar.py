@@ -8,13 +8,15 @@ from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 import pytz
 
+# Partial responses: only the fields this module and its callers read
+EVENT_LIST_FIELDS = 'items(start,summary,description)'
 
 
 def get_calendar_timezone(credentials: Credentials) -> str:
     #creds = get_creds()
     service = build("calendar", "v3", credentials=credentials)
     try:
-      calendar = service.calendars().get(calendarId='primary').execute()
+      calendar = service.calendars().get(calendarId='primary', fields='timeZone').execute()
       return calendar.get('timeZone','UTC')
     except:
       return 'UTC'
@@ -47,6 +49,7 @@ def fetch_date_events(credentials: Credentials ,start_date, timezone):
             maxResults=10,
             singleEvents=True,
             orderBy="startTime",
+            fields=EVENT_LIST_FIELDS,
         )
         .execute()
     )
@@ -56,13 +59,27 @@ def fetch_date_events(credentials: Credentials ,start_date, timezone):
     for event in events:
       
       start = event["start"].get("dateTime", event["start"].get("date"))
-      print(start, event["summary"])
+      print(start, event.get("summary"))
     
     return events
 
   except HttpError as error:
     print(f"An error occurred: {error}")
 
+def query_free_busy(credentials: Credentials, time_min, time_max, timezone):
+  """Busy periods of the primary calendar between two aware datetimes, in one freebusy.query call"""
+  service = build("calendar", "v3", credentials=credentials)
+  result = service.freebusy().query(
+      body={
+          'timeMin': time_min.isoformat(),
+          'timeMax': time_max.isoformat(),
+          'timeZone': timezone,
+          'items': [{'id': 'primary'}]
+      },
+      fields='calendars/primary/busy'
+  ).execute()
+  return result.get('calendars', {}).get('primary', {}).get('busy', [])
+
 def get_email_id(event):
   desc = event.get('description', None)
   if not desc:
@@ -92,7 +109,7 @@ def add_events(credentials: Credentials, email_id, event, timezone):
         'timeZone': timezone
       }
     }
-    result = service.events().insert(calendarId='primary', body=event).execute()
+    result = service.events().insert(calendarId='primary', body=event, fields='id,htmlLink').execute()
     return result
   except HttpError as error:
     print(f"An error occurred: {error}")
@@ -0,0 +1,25 @@
+"""Interval index for overlap queries.
+
+Intervals are sorted by start, with a running maximum of their ends. A query
+bisects the starts for the upper bound and the running maximum for the lower
+bound, then scans only the candidates between them, so overlap lookups stay
+logarithmic plus the size of the answer even when intervals overlap each other.
+"""
+from bisect import bisect_left, bisect_right
+from typing import Any, List, Tuple
+
+
+class IntervalIndex:
+    def __init__(self, intervals: List[Tuple[Any, Any, Any]]):
+        """intervals: (start, end, payload) tuples with comparable, half-open bounds"""
+        self.intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [interval[0] for interval in self.intervals]
+        self.max_ends = []
+        for _, end, _ in self.intervals:
+            self.max_ends.append(end if not self.max_ends or end > self.max_ends[-1] else self.max_ends[-1])
+
+    def overlapping(self, start, end) -> List[Any]:
+        """Payloads of intervals that overlap [start, end)"""
+        lo = bisect_right(self.max_ends, start)
+        hi = bisect_left(self.starts, end)
+        return [payload for interval_start, interval_end, payload in self.intervals[lo:hi] if interval_end > start]
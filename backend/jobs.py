@@ -0,0 +1,299 @@
+"""SQLite job store for per-user processing jobs.
+
+Push notifications and scheduled work become rows in processing_jobs. At most
+one pending job exists per user: new notifications for a user who is already
+queued only raise the history id on the queued job.
+
+Any number of workers, in one process or several on the same host, can share the
+store. SQLite in WAL mode needs shared memory on one machine and its locking is
+unreliable over network filesystems, so workers on other hosts are not supported. A worker
+takes a lease on a user before running that user's job and heartbeats it while
+the job runs, so an inbox is handled by one worker at a time. Leases of dead
+workers expire and their jobs go back to the queue. Users are picked by stride
+scheduling weighted by their recent job count, so busy inboxes get a larger but
+bounded share and quiet ones are never starved.
+"""
+import threading
+import time
+from typing import Callable, Optional
+
+MAX_JOB_ATTEMPTS = 3
+LEASE_SECONDS = 60
+STRIDE = 1.0
+ACTIVITY_WINDOW = '-1 hour'
+MAX_ACTIVITY_WEIGHT = 5
+JOB_RETENTION = '-1 day'
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS processing_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            reason TEXT NOT NULL,
+            history_id TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker_id TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_processing_jobs_status ON processing_jobs (status, user_id)")
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS worker_leases (
+            user_id INTEGER PRIMARY KEY,
+            worker_id TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            heartbeat_at REAL NOT NULL
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_schedule (
+            user_id INTEGER PRIMARY KEY,
+            pass REAL NOT NULL DEFAULT 0
+        )
+    """)
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS gmail_watches (
+            user_id INTEGER PRIMARY KEY,
+            history_id TEXT,
+            expiration TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    """)
+
+
+def enqueue_job(cursor, user_id: int, reason: str, history_id: Optional[str] = None):
+    """Queue a job for the user, merging into the user's pending job if there is one"""
+    cursor.execute("""
+        SELECT id, history_id FROM processing_jobs
+        WHERE user_id = ? AND status = 'pending'
+    """, (user_id,))
+    pending = cursor.fetchone()
+    if pending:
+        if history_id and (not pending[1] or int(history_id) > int(pending[1])):
+            cursor.execute("""
+                UPDATE processing_jobs SET history_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+            """, (history_id, pending[0]))
+        return pending[0]
+
+    cursor.execute("""
+        INSERT INTO processing_jobs (user_id, reason, history_id) VALUES (?, ?, ?)
+    """, (user_id, reason, history_id))
+    return cursor.lastrowid
+
+
+def recover_expired_leases(cursor, now: float):
+    """Drop expired leases and put the jobs their workers were running back in the queue"""
+    cursor.execute("DELETE FROM worker_leases WHERE expires_at < ?", (now,))
+
+    orphaned = "status = 'running' AND user_id NOT IN (SELECT user_id FROM worker_leases)"
+    # A newer pending job for the same user already covers an orphaned one
+    cursor.execute(f"""
+        DELETE FROM processing_jobs AS j WHERE {orphaned} AND EXISTS (
+            SELECT 1 FROM processing_jobs p WHERE p.user_id = j.user_id AND p.status = 'pending'
+        )
+    """)
+    cursor.execute(f"""
+        UPDATE processing_jobs
+        SET status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END,
+            error = 'worker lease expired', worker_id = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE {orphaned}
+    """, (MAX_JOB_ATTEMPTS,))
+
+    cursor.execute("""
+        DELETE FROM processing_jobs WHERE status IN ('done', 'failed') AND updated_at < datetime('now', ?)
+    """, (JOB_RETENTION,))
+
+
+def advance_schedule(cursor, user_id: int, floor: float):
+    """Move the user's pass forward by a stride that shrinks with recent activity"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM processing_jobs WHERE user_id = ? AND created_at >= datetime('now', ?)
+    """, (user_id, ACTIVITY_WINDOW))
+    weight = min(max(cursor.fetchone()[0], 1), MAX_ACTIVITY_WEIGHT)
+    cursor.execute("""
+        INSERT INTO user_schedule (user_id, pass) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET pass = MAX(pass, ?) + ?
+    """, (user_id, floor + STRIDE / weight, floor, STRIDE / weight))
+
+
+def claim_next_job(conn, worker_id: str, lease_seconds: float = LEASE_SECONDS) -> Optional[dict]:
+    """Lease the next user due for processing and mark their pending job as running"""
+    now = time.time()
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        recover_expired_leases(cursor, now)
+
+        # Users new to the schedule start level with the least-served user
+        cursor.execute("SELECT COALESCE(MIN(pass), 0) FROM user_schedule")
+        floor = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT j.id, j.user_id, j.reason, j.history_id, j.attempts FROM processing_jobs j
+            LEFT JOIN user_schedule s ON s.user_id = j.user_id
+            WHERE j.status = 'pending' AND j.user_id NOT IN (SELECT user_id FROM worker_leases)
+            ORDER BY COALESCE(s.pass, ?), j.id LIMIT 1
+        """, (floor,))
+        row = cursor.fetchone()
+        if not row:
+            conn.commit()
+            return None
+
+        cursor.execute("""
+            INSERT INTO worker_leases (user_id, worker_id, expires_at, heartbeat_at) VALUES (?, ?, ?, ?)
+        """, (row[1], worker_id, now + lease_seconds, now))
+        cursor.execute("""
+            UPDATE processing_jobs SET status = 'running', attempts = attempts + 1, worker_id = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (worker_id, row[0]))
+        advance_schedule(cursor, row[1], floor)
+        conn.commit()
+        return {'id': row[0], 'user_id': row[1], 'reason': row[2], 'history_id': row[3], 'attempts': row[4] + 1,
+                'worker_id': worker_id}
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def heartbeat(cursor, worker_id: str, user_id: int, lease_seconds: float = LEASE_SECONDS) -> bool:
+    """Extend the worker's lease on the user. False when the lease was lost to another worker"""
+    now = time.time()
+    cursor.execute("""
+        UPDATE worker_leases SET expires_at = ?, heartbeat_at = ? WHERE user_id = ? AND worker_id = ?
+    """, (now + lease_seconds, now, user_id, worker_id))
+    return cursor.rowcount == 1
+
+
+def release_lease(cursor, worker_id: str, user_id: int):
+    cursor.execute("DELETE FROM worker_leases WHERE user_id = ? AND worker_id = ?", (user_id, worker_id))
+
+
+def finish_job(cursor, job: dict, worker_id: str, error: Optional[str] = None):
+    """Mark a job done, or send it back to the queue until it runs out of attempts.
+
+    Does nothing if the job was taken back after this worker lost its lease.
+    """
+    if error is None:
+        status = 'done'
+    elif job['attempts'] < MAX_JOB_ATTEMPTS:
+        status = 'pending'
+    else:
+        status = 'failed'
+    cursor.execute("""
+        UPDATE processing_jobs SET status = ?, error = ?, worker_id = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND status = 'running' AND worker_id = ?
+    """, (status, error, job['id'], worker_id))
+    if status == 'pending':
+        # A newer pending job for the same user already covers this one
+        cursor.execute("""
+            DELETE FROM processing_jobs
+            WHERE id = ? AND EXISTS (
+                SELECT 1 FROM processing_jobs WHERE user_id = ? AND status = 'pending' AND id != ?
+            )
+        """, (job['id'], job['user_id'], job['id']))
+    release_lease(cursor, worker_id, job['user_id'])
+
+
+def run_worker(connect: Callable, handle: Callable[[dict], None], worker_id: str, stop: threading.Event,
+               lease_seconds: float = LEASE_SECONDS, poll_seconds: float = 2):
+    """Claim and run jobs until stop is set. handle raises to report a failed job."""
+    while not stop.is_set():
+        try:
+            with connect() as conn:
+                job = claim_next_job(conn, worker_id, lease_seconds)
+        except Exception as e:
+            print(f"Error claiming job: {e}")
+            job = None
+
+        if not job:
+            stop.wait(poll_seconds)
+            continue
+
+        done = threading.Event()
+        threading.Thread(target=keep_lease, args=(connect, worker_id, job['user_id'], lease_seconds, done),
+                         name=f"lease-{job['user_id']}", daemon=True).start()
+        error = None
+        try:
+            handle(job)
+        except Exception as e:
+            error = str(getattr(e, 'detail', e))
+            print(f"Error processing job {job['id']} for user {job['user_id']}: {error}")
+        finally:
+            done.set()
+
+        try:
+            with connect() as conn:
+                finish_job(conn.cursor(), job, worker_id, error)
+                conn.commit()
+        except Exception as e:
+            # The lease expires and recover_expired_leases sends the job back
+            print(f"Error finishing job {job['id']} for user {job['user_id']}: {e}")
+
+
+def keep_lease(connect: Callable, worker_id: str, user_id: int, lease_seconds: float, done: threading.Event):
+    while not done.wait(lease_seconds / 3):
+        try:
+            with connect() as conn:
+                held = heartbeat(conn.cursor(), worker_id, user_id, lease_seconds)
+                conn.commit()
+            if not held:
+                print(f"Worker {worker_id} lost its lease on user {user_id}")
+                return
+        except Exception as e:
+            print(f"Error renewing lease on user {user_id}: {e}")
+
+
+def get_watch(cursor, user_id: int) -> Optional[dict]:
+    cursor.execute("SELECT history_id, expiration FROM gmail_watches WHERE user_id = ?", (user_id,))
+    row = cursor.fetchone()
+    return {'history_id': row[0], 'expiration': row[1]} if row else None
+
+
+def save_watch(cursor, user_id: int, history_id: Optional[str], expiration: Optional[str] = None):
+    cursor.execute("""
+        INSERT INTO gmail_watches (user_id, history_id, expiration) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            history_id = COALESCE(excluded.history_id, history_id),
+            expiration = COALESCE(excluded.expiration, expiration),
+            updated_at = CURRENT_TIMESTAMP
+    """, (user_id, history_id, expiration))
+
+
+def save_watch_if_leased(conn, worker_id: str, user_id: int, history_id: Optional[str]) -> bool:
+    """Save the watch's history id only while the worker still holds the user's lease.
+
+    A worker that lost its lease may still be finishing the job; it must not overwrite
+    the newer history id written by the worker that took the user over.
+    """
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("""
+            SELECT 1 FROM worker_leases WHERE user_id = ? AND worker_id = ? AND expires_at >= ?
+        """, (user_id, worker_id, time.time()))
+        held = cursor.fetchone() is not None
+        if held:
+            save_watch(cursor, user_id, history_id)
+        conn.commit()
+        return held
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def get_watches_expiring(cursor, before: str) -> list:
+    """User ids whose watch is missing or expires before the given timestamp"""
+    cursor.execute("""
+        SELECT gc.user_id FROM google_credentials gc
+        LEFT JOIN gmail_watches gw ON gw.user_id = gc.user_id
+        WHERE gw.expiration IS NULL OR gw.expiration < ?
+    """, (before,))
+    return [row[0] for row in cursor.fetchall()]
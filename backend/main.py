@@ -1,31 +1,56 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, PlainTextResponse
 import sqlite3
-from contextlib import contextmanager
-from typing import Dict, List, Optional, Literal
+from contextlib import contextmanager, asynccontextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Literal, Tuple
 import json
+import re
 import jwt
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, field_serializer, field_validator, model_validator
 import uuid
+import socket
+import hashlib
+import base64
+import functools
+import threading
+import time
 import os
 from dotenv import load_dotenv
 import uvicorn
+import pytz
 
 #google Oauth and API imports
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from google import genai
 from google.genai import types
-from gmail import new_fetch
-from google_calendar import get_calendar_timezone, fetch_date_events, add_events, get_email_id
+from gmail import new_fetch, list_message_ids, iter_messages, watch_inbox, iter_added_message_ids
+from google_calendar import get_calendar_timezone, fetch_date_events, add_events, get_email_id, query_free_busy
+import dedup
+import jobs
+import search
+import routing
+import decoding
+from intervals import IntervalIndex
+from deadline import Deadline, DeadlineExceeded, call_with_deadline
+import profiling
+from profiling import profiled
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_background_workers()
+    yield
+    background_stop.set()
+
+app = FastAPI(lifespan=lifespan)
 load_dotenv() #Load env so we don't need to set up api keys
 
 app.add_middleware(
@@ -34,14 +59,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(profiling.ProfileRequestMiddleware)
 
 # Security configuration
 SECRET_KEY = "secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ADMIN_USERNAMES = {name.strip() for name in os.getenv('ADMIN_USERNAMES', '').split(',') if name.strip()}  # no admins unless set
 
-DATABASE_URL = 'ai_app.db'
+DATABASE_URL = os.getenv('DATABASE_URL', 'ai_app.db')  # shared by the web app and every worker process
+DATABASE_TIMEOUT_SECONDS = 30
+SNAPSHOT_HISTORY = 5  # dashboard snapshots kept per user for delta requests
 
 #Google
 GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
@@ -56,7 +86,41 @@ SCOPES = [
 ]
 
 genai_client = genai.Client()
-GEMINI_MODEL = 'gemini-2.5-flash'
+# Model chain per AI stage, cheapest first; MODEL_ROUTES_FILE overrides chains (see routing.py)
+MODEL_ROUTES = routing.load_routes(os.getenv('MODEL_ROUTES_FILE'))
+REASK_LIMIT = int(os.getenv('REASK_LIMIT', '1'))  # re-asks with the validation errors before moving to the next model
+
+# Near-duplicate reuse of AI results for mail sent to many users
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_MAX_DISTANCE = int(os.getenv('DEDUP_MAX_DISTANCE', '6'))  # SimHash bits, at most 7
+DEDUP_MAX_AGE_HOURS = int(os.getenv('DEDUP_MAX_AGE_HOURS', '72'))
+DEDUP_BULK_ONLY = os.getenv('DEDUP_BULK_ONLY', 'true').lower() == 'true'  # keep personal mail out of the shared index
+
+# Deadline budgets for interactive requests
+FETCH_DEADLINE_SECONDS = float(os.getenv('FETCH_DEADLINE_SECONDS', '25'))
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv('UPSTREAM_TIMEOUT_SECONDS', '15'))  # cap for any single Gemini or Google call
+HEDGE_AFTER_SECONDS = float(os.getenv('HEDGE_AFTER_SECONDS', '0')) or None  # start a second attempt of slow calls, off when 0
+
+# Opt-in request profiling, switched at runtime through /admin/profiling
+profiling.settings.enabled = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+profiling.settings.sample_rate = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+profiling.settings.max_profiles = int(os.getenv('PROFILING_MAX_PROFILES', '50'))
+profiling.settings.directory = os.getenv('PROFILING_DIR', 'profiles')
+
+# Speculative summarization: start the likely summary alongside categorization
+SPECULATIVE_SUMMARY = os.getenv('SPECULATIVE_SUMMARY', 'false').lower() == 'true'
+SPECULATIVE_CATEGORIES = set(os.getenv('SPECULATIVE_CATEGORIES', 'event,general').split(','))  # predicted categories worth speculating on
+SPECULATIVE_EVENT_HINTS = int(os.getenv('SPECULATIVE_EVENT_HINTS', '2'))  # keyword hits needed to predict an event
+EVENT_HINT_PATTERN = re.compile(r'\b(invit\w*|rsvp|meeting|webinar|party|dinner|lunch|appointment|conference|interview|join us|save the date|calendar|ceremony)\b', re.IGNORECASE)
+speculation_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="speculative-summary")
+
+# Gmail push notifications: users.watch -> Pub/Sub push subscription -> /gmail/push
+GMAIL_PUBSUB_TOPIC = os.getenv('GMAIL_PUBSUB_TOPIC')  # projects/<project>/topics/<topic>, push mode is off when unset
+PUSH_VERIFICATION_TOKEN = os.getenv('PUSH_VERIFICATION_TOKEN')  # passed as ?token= on the push endpoint URL
+WATCH_RENEW_INTERVAL_SECONDS = 6 * 60 * 60
+WATCH_RENEW_BEFORE = timedelta(days=1)  # watches last 7 days
+JOB_POLL_SECONDS = 2
+INLINE_WORKER_THREADS = int(os.getenv('INLINE_WORKER_THREADS', '1'))  # set to 0 when running worker.py processes
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -73,7 +137,7 @@ class UserLogin(BaseModel):
 
 class CategorizeEmails(BaseModel):
     importance: bool = Field(description="Determine if this email is important based on its impact: For general emails - important if it greatly affects daily life, personal responsibilities, or requires immediate action (financial alerts, service outages, critical updates). For events - important if attendance is strictly advised or impacts personal/professional life (work meetings, close friend invitations, birthday parties). Mass promotional events are not important.")
-    category: Literal['general','email'] = Field(description="Classify the email type: 'event' if the email contains an invitation to an occasion (meetings, dinners, parties, conferences, appointments). 'general' for all other emails including newsletters, notifications, updates, personal messages, or any communication that is not an invitation.")
+    category: Literal['general','event'] = Field(description="Classify the email type: 'event' if the email contains an invitation to an occasion (meetings, dinners, parties, conferences, appointments). 'general' for all other emails including newsletters, notifications, updates, personal messages, or any communication that is not an invitation.")
 
 class EventSummary(BaseModel):
     event_name: str = Field(description='Name of the event')
@@ -82,15 +146,63 @@ class EventSummary(BaseModel):
     event_end: datetime = Field(description='End Date and time of the event. MUST use format: YYYY-MM-DD HH:MM (e.g., 2025-07-29 14:30). If none specified, add 1 hour to start time.')
     event_summary: str= Field(description='Summary of the email and event')
 
+    @model_validator(mode='before')
+    @classmethod
+    def default_end(cls, data):
+        if isinstance(data, dict) and data.get('event_start') and not data.get('event_end'):
+            data = {**data, 'event_end': data['event_start']}
+        return data
+
+    @field_validator('event_start', 'event_end', mode='before')
+    @classmethod
+    def parse_time(cls, value):
+        return decoding.parse_event_time(value)
+
+    @field_validator('event_name', 'event_summary')
+    @classmethod
+    def not_blank(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError('must not be empty')
+        return value.strip()
+
+    @model_validator(mode='after')
+    def end_after_start(self):
+        if self.event_end <= self.event_start:
+            self.event_end = self.event_start + timedelta(hours=1)
+        return self
+
+    @field_serializer('event_start', 'event_end')
+    def format_time(self, value: datetime) -> str:
+        return value.strftime(decoding.EVENT_TIME_FORMAT)
+
 class GeneralSummary(BaseModel):
     email_summary: str= Field(description='Detailed summary of the email')
 
+    @field_validator('email_summary')
+    @classmethod
+    def not_blank(cls, value: str) -> str:
+        if not value.strip():
+            raise ValueError('must not be empty')
+        return value.strip()
+
 class EmailFetchRequest(BaseModel):
     email_count: int= 10
 
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = Field(default=None, ge=0, le=1)
+    interval_ms: Optional[float] = Field(default=None, ge=1, le=1000)
+
+class PushEnvelope(BaseModel):
+    message: Dict
+    subscription: Optional[str] = None
+
 def init_database():
-    with sqlite3.connect(DATABASE_URL) as conn:
+    with sqlite3.connect(DATABASE_URL, timeout=DATABASE_TIMEOUT_SECONDS) as conn:
         cursor = conn.cursor()
+        # WAL lets readers carry on while a worker holds the write lock. It needs every
+        # process on one host: WAL uses shared memory and does not work over network filesystems
+        cursor.execute("PRAGMA journal_mode=WAL")
 
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS users (
@@ -128,12 +240,65 @@ def init_database():
             )
         """)
 
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS linked_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                email_id TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+                UNIQUE(user_id, email_id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS processed_emails (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                email_id TEXT NOT NULL,
+                sender TEXT,
+                subject TEXT,
+                ai_result TEXT NOT NULL,
+                processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+                UNIQUE(user_id, email_id)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS dashboard_snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                version TEXT NOT NULL,
+                data TEXT NOT NULL,
+                calendar_timezone TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+                UNIQUE(user_id, version)
+            )
+        """)
+        cursor.execute("PRAGMA table_info(dashboard_snapshots)")
+        if 'calendar_timezone' not in {row[1] for row in cursor.fetchall()}:
+            cursor.execute("ALTER TABLE dashboard_snapshots ADD COLUMN calendar_timezone TEXT")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+        dedup.create_tables(cursor)
+        jobs.create_tables(cursor)
+        search.create_tables(cursor)
+        routing.create_tables(cursor)
+
         conn.commit()
         print("Database intialized successfully")
 
 @contextmanager
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_URL)
+    conn = sqlite3.connect(DATABASE_URL, timeout=DATABASE_TIMEOUT_SECONDS)
     conn.row_factory = sqlite3.Row
     try:
         yield conn
@@ -167,6 +332,15 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid authentication credentials")
     
+def require_admin(current_user_id: int = Depends(verify_token)):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT username FROM users WHERE id = ?", (current_user_id,))
+        user = cursor.fetchone()
+    if not user or user['username'] not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user_id
+    
 def create_google_oauth_flow():
     flow = Flow.from_client_config(
         {
@@ -239,14 +413,24 @@ def save_google_credentials(user_id: int, credentials: Credentials, google_email
         """, (user_id, credentials.token, credentials.refresh_token, credentials.expiry, google_email))
         conn.commit()
 
-def fetch_emails(credentials: Credentials, email_count: int = 10) -> List[Dict]:
+def fetch_emails(credentials: Credentials, email_count: int = 10) -> Iterator[Dict]:
     try:
-        results = new_fetch(credentials=credentials, email_count=email_count)
+        yield from new_fetch(credentials=credentials, email_count=email_count)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f'Failed to fetch emails: {str(e)}')
-    
-    return results
+
+def list_email_ids(credentials: Credentials, email_count: int = 10) -> List[str]:
+    try:
+        return list_message_ids(credentials=credentials, email_count=email_count)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to list emails: {str(e)}')
+
+def fetch_email_bodies(credentials: Credentials, email_ids: List[str]) -> Iterator[Dict]:
+    try:
+        yield from iter_messages(credentials=credentials, message_ids=email_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f'Failed to fetch emails: {str(e)}')
 
 def add_cal_event(credentials: Credentials, email_id: str, event_data: Dict, timezone: str) -> Dict:
     try:
@@ -286,8 +470,260 @@ def add_ignored_event(user_id: int, email_id: str):
         """, (user_id, email_id))
         conn.commit()
 
+def get_linked_event_ids(user_id: int) -> set:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT email_id FROM linked_events WHERE user_id = ?", (user_id,))
+        return set(row['email_id'] for row in cursor.fetchall())
+
+def add_linked_event(user_id: int, email_id: str):
+    """Record that an email's event was added to the user's calendar"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR IGNORE INTO linked_events (user_id, email_id)
+            VALUES (?, ?)
+        """, (user_id, email_id))
+        conn.commit()
+
+def get_processed_emails(user_id: int, email_ids: List[str]) -> Dict[str, Dict]:
+    """Return stored AI results for the given email ids, keyed by email id"""
+    if not email_ids:
+        return {}
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" for _ in email_ids)
+        cursor.execute(f"""
+            SELECT email_id, sender, subject, ai_result FROM processed_emails
+            WHERE user_id = ? AND email_id IN ({placeholders})
+        """, (user_id, *email_ids))
+        return {
+            row['email_id']: {
+                'id': row['email_id'],
+                'sender': row['sender'],
+                'subject': row['subject'],
+                'ai_result': json.loads(row['ai_result'])
+            }
+            for row in cursor.fetchall()
+        }
+
+def save_processed_email(user_id: int, email: Dict, ai_result: Dict):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO processed_emails (user_id, email_id, sender, subject, ai_result)
+            VALUES (?, ?, ?, ?, ?)
+        """, (user_id, email['id'], email['sender'], email.get('subject', ''), json.dumps(ai_result, default=str)))
+        if ai_result.get('importance') and ai_result.get('content'):
+            search.index_summary(cursor, user_id, email, ai_result['category'], ai_result['content'])
+        conn.commit()
+
+def compute_snapshot_version(email_ids: List[str], ignored_ids: set, linked_ids: set) -> str:
+    """Version the dashboard by the emails it covers and the user's ignored and linked events"""
+    digest = hashlib.sha256()
+    for section in (sorted(email_ids), sorted(ignored_ids), sorted(linked_ids)):
+        digest.update("\x1f".join(section).encode())
+        digest.update(b"\x1e")
+    return digest.hexdigest()[:32]
+
+def load_snapshot(user_id: int, version: str) -> Optional[Tuple[Dict, Optional[str]]]:
+    """(data, calendar_timezone) of a stored snapshot; the timezone is None when it was not looked up"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT data, calendar_timezone FROM dashboard_snapshots WHERE user_id = ? AND version = ?
+        """, (user_id, version))
+        row = cursor.fetchone()
+        return (json.loads(row['data']), row['calendar_timezone']) if row else None
+
+def get_snapshot(user_id: int, version: str) -> Optional[Dict]:
+    snapshot = load_snapshot(user_id, version)
+    return snapshot[0] if snapshot else None
+
+def save_snapshot(user_id: int, version: str, data: Dict, calendar_timezone: Optional[str] = None):
+    """Store a dashboard snapshot, keeping only the most recent SNAPSHOT_HISTORY per user.
+
+    The calendar timezone is kept with it, so a cached load checks conflicts without looking it up again.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO dashboard_snapshots (user_id, version, data, calendar_timezone)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, version, json.dumps(data, default=str), calendar_timezone))
+        cursor.execute("""
+            DELETE FROM dashboard_snapshots
+            WHERE user_id = ? AND id NOT IN (
+                SELECT id FROM dashboard_snapshots WHERE user_id = ? ORDER BY id DESC LIMIT ?
+            )
+        """, (user_id, user_id, SNAPSHOT_HISTORY))
+        conn.commit()
+
+def conditional_response(response: Response, version: str, data: Dict, if_none_match: Optional[str]):
+    """Answer with 304 when the client already holds this version, otherwise tag the data with an ETag"""
+    if data.get('partial'):
+        # Incomplete results are not that version: carrying it would let a later If-None-Match
+        # or since= skip the emails left unprocessed, so they get no version and are not cacheable
+        response.headers['Cache-Control'] = 'no-store'
+        return {**data, 'version': None}
+
+    # The version covers the inbox only; the digest changes the tag when calendar conflicts do
+    conflicts = json.dumps(conflicts_by_email(data), sort_keys=True, default=str)
+    etag = f'"{version}-{hashlib.sha256(conflicts.encode()).hexdigest()[:12]}"'
+    if if_none_match:
+        client_tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        if etag in client_tags or '*' in client_tags:
+            return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+    response.headers['ETag'] = etag
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return {**data, 'version': version}
+
+def diff_snapshots(old: Dict, new: Dict) -> Dict:
+    """Items added to and email ids removed from each dashboard section between two snapshots.
+
+    Emails the new result left unprocessed are missing from it, not removed.
+    """
+    unprocessed = set(new.get('unprocessed_email_ids', []))
+    delta = {}
+    for section in ('summarized_emails', 'pending_events'):
+        old_ids = {item['email_id'] for item in old.get(section, [])}
+        new_ids = {item['email_id'] for item in new.get(section, [])}
+        delta[section] = {
+            'added': [item for item in new.get(section, []) if item['email_id'] not in old_ids],
+            'removed': sorted(old_ids - new_ids - unprocessed)
+        }
+    return delta
+
+def increment_counter(name: str, amount: int = 1):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO counters (name, value) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET value = value + excluded.value
+        """, (name, amount))
+        conn.commit()
+
+def get_counters(prefix: str) -> Dict[str, int]:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT name, value FROM counters WHERE name LIKE ?", (f"{prefix}%",))
+        return {row['name'][len(prefix):]: row['value'] for row in cursor.fetchall()}
+
+def sqlite_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """UTC in the format CURRENT_TIMESTAMP columns use, naive values taken as UTC"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+def generate_content(model: str, contents, config: types.GenerateContentConfig, deadline: Optional[Deadline] = None,
+                     record: Optional[Callable] = None):
+    """Call Gemini within the remaining budget, hedging slow calls when HEDGE_AFTER_SECONDS is set.
+
+    A hedged request can make two billed calls but returns one response. record(response,
+    latency, outcome) is called for every call whose response the caller does not get:
+    failed calls as 'error', and the losing or abandoned successful ones as 'unused'.
+    """
+    timeout = deadline.timeout(UPSTREAM_TIMEOUT_SECONDS) if deadline else UPSTREAM_TIMEOUT_SECONDS
+    # Also bound the HTTP call itself, so an abandoned attempt does not linger
+    config.http_options = types.HttpOptions(timeout=max(int(timeout * 1000), 1))
+    lock = threading.Lock()
+    state = {'response': None, 'latency': 0.0, 'abandoned': False}
+
+    def call():
+        started = time.perf_counter()
+        try:
+            response = genai_client.models.generate_content(model=model, contents=contents, config=config)
+        except Exception:
+            if record:
+                record(None, time.perf_counter() - started, 'error')
+            raise
+        latency = time.perf_counter() - started
+        with lock:
+            unused = state['response'] is not None or state['abandoned']
+            if not unused:
+                state['response'], state['latency'] = response, latency
+        if unused and record:
+            record(response, latency, 'unused')
+        return response
+
+    try:
+        call_with_deadline(call, deadline=deadline, cap=UPSTREAM_TIMEOUT_SECONDS, hedge_after=HEDGE_AFTER_SECONDS)
+    except Exception:
+        # Timed out after a call succeeded: nobody gets that response either
+        with lock:
+            state['abandoned'] = True
+            response = state['response']
+        if response is not None and record:
+            record(response, state['latency'], 'unused')
+        raise
+    return state['response']
+
+STAGE_SCHEMAS = {
+    'categorize': CategorizeEmails,
+    'event_summary': EventSummary,
+    'general_summary': GeneralSummary,
+}
+
+def record_model_usage(user_id: Optional[int], stage: str, model: str, attempt: int, response, latency: float, outcome: str,
+                       reask: int = 0):
+    try:
+        with get_db_connection() as conn:
+            routing.record_usage(conn.cursor(), user_id, stage, model, attempt, response, latency, outcome, reask)
+            conn.commit()
+    except sqlite3.Error as e:
+        print(f"Error recording model usage: {e}")
+
+def reask_contents(contents: List, response, function_name: str, error: decoding.DecodeError) -> List:
+    """The conversation so far plus the model's rejected answer and the validation errors"""
+    contents = list(contents)
+    if response is not None and response.candidates and response.candidates[0].content:
+        contents.append(response.candidates[0].content)
+    if error.called:
+        feedback = types.Part.from_function_response(name=function_name, response={'error': f"Invalid arguments, call {function_name} again with these fixed:\n{error}"})
+    else:
+        feedback = types.Part.from_text(text=str(error))
+    contents.append(types.Content(role='user', parts=[feedback]))
+    return contents
+
+def run_stage(stage: str, function_name: str, email_text: str, config: types.GenerateContentConfig,
+              deadline: Optional[Deadline] = None, user_id: Optional[int] = None) -> Optional[Dict]:
+    """Call the stage's models in order until one returns output that decodes against the stage's schema.
+
+    A model whose output fails validation is re-asked up to REASK_LIMIT times with the
+    errors before the next model is tried. Only this email is sent again.
+    """
+    for attempt, model in enumerate(MODEL_ROUTES[stage]):
+        contents = [types.Content(role='user', parts=[types.Part.from_text(text=email_text)])]
+        for reask in range(REASK_LIMIT + 1):
+            if deadline and deadline.expired():
+                return None
+            response, error, outcome = None, None, 'error'
+            started = time.perf_counter()
+            # Calls whose response never reaches us (failed, hedged or abandoned) record themselves
+            record = functools.partial(record_model_usage, user_id, stage, model, attempt, reask=reask)
+            try:
+                response = generate_content(model, contents, config, deadline, record)
+                result = decoding.decode(STAGE_SCHEMAS[stage], decoding.function_args(response, function_name))
+                outcome = 'ok'
+            except decoding.DecodeError as e:
+                error, outcome = e, 'invalid'
+            except Exception as e:
+                print(f"Error calling {model} for {stage}: {str(e)}")
+            if response is not None:
+                record_model_usage(user_id, stage, model, attempt, response, time.perf_counter() - started, outcome, reask)
+
+            if outcome == 'ok':
+                return result
+            if error is None:
+                break  # the call itself failed, try the next model
+            contents = reask_contents(contents, response, function_name, error)
+    return None
+
 #feed to ai functions
-def categorize_email(email_text: str) -> Dict:
+def categorize_email(email_text: str, deadline: Optional[Deadline] = None, user_id: Optional[int] = None) -> Dict:
     system_instruction = """You are an email categorization agent. Analyze the email and determine:
     1. Is this email important?
     2. What category does it belong to (event or general)?
@@ -303,30 +739,15 @@ def categorize_email(email_text: str) -> Dict:
     
     config = types.GenerateContentConfig(tools=tools, system_instruction=system_instruction)
 
-    try:
-        response = genai_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=email_text,
-            config=config
-        )
-        
-        # Extract categorization result
-        if response.candidates[0].content.parts:
-            for part in response.candidates[0].content.parts:
-                if hasattr(part, 'function_call') and part.function_call.name == "CategorizeEmails":
-                    function_args = dict(part.function_call.args)
-                    return {
-                        'importance': function_args.get('importance', False),
-                        'category': function_args.get('category', 'general')
-                    }
-        
-        return {'importance': False, 'category': 'general'}
-    
-    except Exception as e:
-        print(f"Error categorizing email: {str(e)}")
-        return {'importance': False, 'category': 'general'}
+    function_args = run_stage('categorize', "CategorizeEmails", email_text, config, deadline, user_id)
+    if function_args is None:
+        return {'importance': False, 'category': 'general', 'error': True}
+    return {
+        'importance': function_args['importance'],
+        'category': function_args['category']
+    }
 
-def summarize_event_email(email_text: str) -> Dict:
+def summarize_event_email(email_text: str, deadline: Optional[Deadline] = None, user_id: Optional[int] = None) -> Dict:
     """Second step: Summarize event email with detailed event information."""
     system_instruction = f"""You are an event summarization agent. Extract all event details from this email including:
     - Event name and type
@@ -345,26 +766,9 @@ def summarize_event_email(email_text: str) -> Dict:
     
     config = types.GenerateContentConfig(tools=tools, system_instruction=system_instruction)
     
-    try:
-        response = genai_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=email_text,
-            config=config
-        )
-        
-        # Extract event summary result
-        if response.candidates[0].content.parts:
-            for part in response.candidates[0].content.parts:
-                if hasattr(part, 'function_call') and part.function_call.name == "EventSummary":
-                    return dict(part.function_call.args)
-        
-        return {}
-    
-    except Exception as e:
-        print(f"Error summarizing event email: {str(e)}")
-        return {}
+    return run_stage('event_summary', "EventSummary", email_text, config, deadline, user_id) or {}
 
-def summarize_general_email(email_text: str) -> Dict:
+def summarize_general_email(email_text: str, deadline: Optional[Deadline] = None, user_id: Optional[int] = None) -> Dict:
     """Second step: Summarize general email content."""
     system_instruction = """You are a general email summarization agent. Provide a comprehensive summary of this email's content, highlighting:
     - Key points and main message
@@ -383,33 +787,49 @@ def summarize_general_email(email_text: str) -> Dict:
     
     config = types.GenerateContentConfig(tools=tools, system_instruction=system_instruction)
     
-    try:
-        response = genai_client.models.generate_content(
-            model=GEMINI_MODEL,
-            contents=email_text,
-            config=config
-        )
-        
-        # Extract general summary result
-        if response.candidates[0].content.parts:
-            for part in response.candidates[0].content.parts:
-                if hasattr(part, 'function_call') and part.function_call.name == "GeneralSummary":
-                    return dict(part.function_call.args)
-        
-        return {}
-    
-    except Exception as e:
-        print(f"Error summarizing general email: {str(e)}")
-        return {}
+    return run_stage('general_summary', "GeneralSummary", email_text, config, deadline, user_id) or {}
+
+def predict_category(email_text: str) -> str:
+    """Cheap keyword guess at the category, only used to pick which summary to start early"""
+    hints = EVENT_HINT_PATTERN.findall(email_text[:4000])
+    return 'event' if len(hints) >= SPECULATIVE_EVENT_HINTS else 'general'
 
-def categorize_and_summarize_email(email_text: str) -> Dict:
-    """Main function: Categorize first, then summarize based on category and importance."""
+def start_speculative_summary(email_text: str, deadline: Optional[Deadline] = None, user_id: Optional[int] = None) -> Optional[Dict]:
+    predicted = predict_category(email_text)
+    if predicted not in SPECULATIVE_CATEGORIES:
+        return None
+    summarize = summarize_event_email if predicted == 'event' else summarize_general_email
+    increment_counter(f'speculative.{predicted}.started')
+    return {'category': predicted, 'future': speculation_pool.submit(profiling.traced(summarize), email_text, deadline, user_id)}
+
+def discard_speculation(speculation: Optional[Dict]):
+    if not speculation:
+        return
+    # cancel() only succeeds while the call is still queued, otherwise the Gemini call is spent
+    outcome = 'cancelled' if speculation['future'].cancel() else 'wasted'
+    increment_counter(f"speculative.{speculation['category']}.{outcome}")
+
+def categorize_and_summarize_email(email_text: str, deadline: Optional[Deadline] = None, user_id: Optional[int] = None) -> Dict:
+    """Main function: Categorize first, then summarize based on category and importance.
+
+    With SPECULATIVE_SUMMARY on, the summary for the predicted category runs alongside
+    categorization and is dropped if the email is unimportant or in the other category.
+    """
+    speculation = None
     try:
+        if SPECULATIVE_SUMMARY:
+            speculation = start_speculative_summary(email_text, deadline, user_id)
+
         # Step 1: Categorize the email
-        categorization = categorize_email(email_text)
+        categorization = categorize_email(email_text, deadline, user_id)
         
+        if categorization.get('error'):
+            discard_speculation(speculation)
+            return {'importance': False, 'category': 'general', 'content': {}, 'error': True}
+
         # If not important, return early with minimal data
         if not categorization['importance']:
+            discard_speculation(speculation)
             return {
                 'importance': False,
                 'category': categorization['category'],
@@ -417,20 +837,81 @@ def categorize_and_summarize_email(email_text: str) -> Dict:
             }
         
         # Step 2: Summarize based on category (only for important emails)
-        if categorization['category'] == 'event':
-            content = summarize_event_email(email_text)
+        if speculation and speculation['category'] == categorization['category']:
+            content = speculation['future'].result()
+            increment_counter(f"speculative.{speculation['category']}.used")
         else:
-            content = summarize_general_email(email_text)
+            discard_speculation(speculation)
+            if categorization['category'] == 'event':
+                content = summarize_event_email(email_text, deadline, user_id)
+            else:
+                content = summarize_general_email(email_text, deadline, user_id)
         
-        return {
+        result = {
             'importance': True,
             'category': categorization['category'],
             'content': content
         }
+        if not content:
+            result['error'] = True
+        return result
     
     except Exception as e:
         print(f"Error in categorize_and_summarize_email: {str(e)}")
-        return {'importance': False, 'category': 'general', 'content': {}}
+        return {'importance': False, 'category': 'general', 'content': {}, 'error': True}
+
+def normalize_stored_result(ai_result: Dict) -> Optional[Dict]:
+    """A stored AI result decoded like a fresh one, or None when it no longer decodes and should be redone.
+
+    Results saved before output validation may carry other date formats or bad fields.
+    """
+    if ai_result.get('error') or not ai_result.get('importance'):
+        return ai_result
+    schema = EventSummary if ai_result.get('category') == 'event' else GeneralSummary
+    try:
+        return {**ai_result, 'content': decoding.decode(schema, ai_result.get('content'))}
+    except decoding.DecodeError:
+        return None
+
+def llm_calls_for(ai_result: Dict) -> int:
+    """Gemini calls categorize_and_summarize_email spends to produce this result"""
+    return 2 if ai_result.get('importance') else 1
+
+def analyze_email(email: Dict, deadline: Optional[Deadline] = None, user_id: Optional[int] = None) -> Dict:
+    """Categorize and summarize an email, reusing the result of a near-identical one when possible.
+
+    Only bulk mail (lists, newsletters) takes part unless DEDUP_BULK_ONLY is off,
+    so personal mail is never shared between users. Failed results are not indexed,
+    and neither are event results, whose dates and times belong to one recipient.
+    """
+    if not DEDUP_ENABLED or (DEDUP_BULK_ONLY and not email.get('bulk')):
+        return categorize_and_summarize_email(email['text'], deadline, user_id)
+
+    fingerprint = dedup.simhash(email['text'])
+    if fingerprint is None:
+        return categorize_and_summarize_email(email['text'], deadline, user_id)
+    signature = dedup.exact_signature(email['text'])
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        match = dedup.find_near_duplicate(cursor, fingerprint, signature, DEDUP_MAX_DISTANCE, DEDUP_MAX_AGE_HOURS)
+        if match:
+            dedup.record_hit(cursor, match['id'])
+            conn.commit()
+
+    increment_counter('dedup.lookups')
+    ai_result = normalize_stored_result(json.loads(match['ai_result'])) if match else None
+    if ai_result is not None:
+        increment_counter('dedup.hits')
+        increment_counter('dedup.llm_calls_avoided', llm_calls_for(ai_result))
+        return ai_result
+
+    ai_result = categorize_and_summarize_email(email['text'], deadline, user_id)
+    if not ai_result.get('error') and ai_result.get('category') != 'event':
+        with get_db_connection() as conn:
+            dedup.store_fingerprint(conn.cursor(), fingerprint, signature, json.dumps(ai_result, default=str))
+            conn.commit()
+    return ai_result
 
 
 init_database()
@@ -525,6 +1006,12 @@ def google_callback(code: str, state:str):
 
         save_google_credentials(user_id=user_id, credentials=credentials, google_email=google_email)
 
+        if GMAIL_PUBSUB_TOPIC:
+            try:
+                start_watch(user_id, credentials)
+            except Exception as e:
+                print(f"Error starting Gmail watch: {e}")
+
         return RedirectResponse(url="http://localhost:3000/?google_auth=success")
     
     except Exception as e:
@@ -535,33 +1022,129 @@ def google_auth_status(current_user_id: int = Depends(verify_token)):
     credentials = get_google_credentials(current_user_id)
     return{'connected': credentials is not None}
 
-@app.post("/fetch-emails")
-def fetch_and_process_emails(
-    request: EmailFetchRequest,
-    current_user_id: int = Depends(verify_token)
-):
+def event_window(content: Dict, tz) -> tuple:
+    """Aware start and end of an extracted event, defaulting to one hour"""
+    start = tz.localize(decoding.parse_event_time(content['event_start']))
     try:
-        credentials = get_google_credentials(current_user_id)
-        if not credentials:
-            raise HTTPException(status_code=400, detail="Google account not connected")
-        
-        emails = fetch_emails(credentials, request.email_count)
+        end = tz.localize(decoding.parse_event_time(content['event_end']))
+    except (KeyError, TypeError, ValueError):
+        end = start
+    if end <= start:
+        end = start + timedelta(hours=1)
+    return start, end
 
-        timezone = get_calendar_timezone(credentials)
+def tag_conflicts(credentials: Credentials, pending_events: List[Dict], calendar_timezone: Optional[str], deadline: Optional[Deadline] = None):
+    """Tag each pending event with the busy calendar periods it overlaps.
 
-        ignored_email_ids = get_ignored_event_ids(current_user_id)
+    One freebusy.query covers the span of all pending events, however many there are,
+    and overlaps are answered from an interval index over the returned busy periods.
+    conflicts is None when the check could not be made.
+    """
+    if not pending_events:
+        return
+
+    try:
+        if calendar_timezone is None:
+            calendar_timezone = call_with_deadline(get_calendar_timezone, credentials, deadline=deadline, cap=UPSTREAM_TIMEOUT_SECONDS)
+        tz = pytz.timezone(calendar_timezone)
+        windows = [event_window(event['content'], tz) for event in pending_events]
+        busy = call_with_deadline(
+            query_free_busy, credentials,
+            min(start for start, _ in windows), max(end for _, end in windows), calendar_timezone,
+            deadline=deadline, cap=UPSTREAM_TIMEOUT_SECONDS, hedge_after=HEDGE_AFTER_SECONDS
+        )
+        index = IntervalIndex([
+            (datetime.fromisoformat(period['start']), datetime.fromisoformat(period['end']), period)
+            for period in busy
+        ])
+    except Exception as e:
+        print(f"Error checking calendar conflicts: {getattr(e, 'detail', e)}")
+        for event in pending_events:
+            event['conflicts'] = None
+        return
+
+    for event, (start, end) in zip(pending_events, windows):
+        event['conflicts'] = [{'start': period['start'], 'end': period['end']} for period in index.overlapping(start, end)]
+
+def with_conflicts(credentials: Credentials, result: Dict, calendar_timezone: Optional[str] = None,
+                   deadline: Optional[Deadline] = None) -> Dict:
+    """Copy of a dashboard result with its pending events tagged with current calendar conflicts.
+
+    Conflicts follow the calendar, which the snapshot version does not cover, so they are
+    worked out for every response and never stored in the snapshot.
+    """
+    pending_events = [dict(event) for event in result['pending_events']]
+    tag_conflicts(credentials, pending_events, calendar_timezone, deadline)
+    return {**result, 'pending_events': pending_events}
+
+def conflicts_by_email(data: Dict) -> Dict[str, Optional[List]]:
+    return {event['email_id']: event.get('conflicts') for event in data.get('pending_events', [])}
+
+def build_dashboard(user_id: int, credentials: Credentials, email_count: int = 10, deadline: Optional[Deadline] = None):
+    """Return (version, data) for the user's dashboard.
+
+    The version covers the listed message ids plus ignored and linked events, so an
+    unchanged inbox is answered from the stored snapshot without touching Gemini.
+    Emails already run through the AI are reused from processed_emails.
+
+    Every upstream call gets its timeout from the deadline. Emails that could not be
+    processed in time, or failed, are listed in unprocessed_email_ids and the result
+    is marked partial; partial results are not stored as the snapshot.
+    """
+    email_ids = call_with_deadline(list_email_ids, credentials, email_count, deadline=deadline, cap=UPSTREAM_TIMEOUT_SECONDS)
+    ignored_email_ids = get_ignored_event_ids(user_id)
+    linked_email_ids = get_linked_event_ids(user_id)
+    version = compute_snapshot_version(email_ids, ignored_email_ids, linked_email_ids)
+
+    snapshot = load_snapshot(user_id, version)
+    if snapshot is not None:
+        data, calendar_timezone = snapshot
+        return version, with_conflicts(credentials, data, calendar_timezone, deadline)
+
+    processed = get_processed_emails(user_id, email_ids)
+    for email_id, email in list(processed.items()):
+        ai_result = normalize_stored_result(email['ai_result'])
+        if ai_result is None:
+            del processed[email_id]  # analyzed again below
+        else:
+            email['ai_result'] = ai_result
+    missing_ids = [email_id for email_id in email_ids if email_id not in processed]
+    if missing_ids:
+        emails = fetch_email_bodies(credentials, missing_ids)
+        while not (deadline and deadline.expired()):
+            try:
+                email = call_with_deadline(next, emails, None, deadline=deadline, cap=UPSTREAM_TIMEOUT_SECONDS)
+            except (DeadlineExceeded, HTTPException) as e:
+                print(f"Stopped fetching emails for user {user_id}: {getattr(e, 'detail', e)}")
+                break
+            if email is None:
+                break
 
-        pending_events = []
-        summarized_emails = []
-        
-        for email in emails:
             # Get AI analysis
-            ai_result = categorize_and_summarize_email(email['text'])
-            if not ai_result:
+            ai_result = analyze_email(email, deadline, user_id)
+            if not ai_result or ai_result.get('error'):
                 continue
-            
-            important = ai_result['importance']
-            
+            save_processed_email(user_id, email, ai_result)
+            # Keep the headers only, so bodies are dropped as soon as they are analyzed
+            processed[email['id']] = {'id': email['id'], 'sender': email['sender'], 'subject': email.get('subject', ''),
+                                      'ai_result': ai_result}
+
+    timezone = None
+
+    pending_events = []
+    summarized_emails = []
+    unprocessed_email_ids = []
+    
+    for email_id in email_ids:
+        email = processed.get(email_id)
+        if not email:
+            unprocessed_email_ids.append(email_id)
+            continue
+        ai_result = email['ai_result']
+        
+        important = ai_result['importance']
+        
+        try:
             if important:
                 if ai_result['category'] != 'event':
                     # Important general email
@@ -576,10 +1159,16 @@ def fetch_and_process_emails(
                     summarized_emails.append(email_data)
                 else:
                     # Important event email
-                    event_start = datetime.strptime(ai_result['content']['event_start'], "%Y-%m-%d %H:%M")
+                    event_start = decoding.parse_event_time(ai_result['content']['event_start'])
+
+                    if timezone is None:
+                        timezone = call_with_deadline(get_calendar_timezone, credentials, deadline=deadline, cap=UPSTREAM_TIMEOUT_SECONDS)
                     
                     # Check calendar for existing events on that date
-                    calendar_events = fetch_calendar(credentials, event_start, timezone)
+                    calendar_events = call_with_deadline(
+                        fetch_calendar, credentials, event_start, timezone,
+                        deadline=deadline, cap=UPSTREAM_TIMEOUT_SECONDS, hedge_after=HEDGE_AFTER_SECONDS
+                    )
                     
                     # Get email IDs from calendar events
                     calendar_email_ids = set()
@@ -589,8 +1178,8 @@ def fetch_and_process_emails(
                             if cal_email_id:
                                 calendar_email_ids.add(cal_email_id)
                     
-                    # Combine calendar email IDs with ignored email IDs
-                    all_excluded_ids = calendar_email_ids.union(ignored_email_ids)
+                    # Combine calendar email IDs with ignored and linked email IDs
+                    all_excluded_ids = calendar_email_ids.union(ignored_email_ids, linked_email_ids)
                     
                     # If email ID is not in excluded list, add to pending events
                     if email['id'] not in all_excluded_ids:
@@ -603,21 +1192,141 @@ def fetch_and_process_emails(
                             'content': ai_result['content']
                         }
                         pending_events.append(event_data)
-            
-            # If not important, skip (continue)
+        except Exception as e:
+            # One bad item should not fail the whole batch
+            print(f"Error building dashboard item {email_id}: {getattr(e, 'detail', e)}")
+            unprocessed_email_ids.append(email_id)
         
-        return {
-            'summarized_emails': summarized_emails,
-            'pending_events': pending_events,
-            'total_emails_processed': len(emails)
-        }
+        # If not important, skip (continue)
+
+    result = {
+        'summarized_emails': summarized_emails,
+        'pending_events': pending_events,
+        'total_emails_processed': len(email_ids) - len(unprocessed_email_ids),
+        'unprocessed_email_ids': unprocessed_email_ids,
+        'partial': bool(unprocessed_email_ids)
+    }
+    if not result['partial']:
+        save_snapshot(user_id, version, result, timezone)
+    return version, with_conflicts(credentials, result, timezone, deadline)
+
+def get_user_id_by_google_email(google_email: str) -> Optional[int]:
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT user_id FROM google_credentials WHERE google_email = ?", (google_email,))
+        row = cursor.fetchone()
+        return row['user_id'] if row else None
+
+def start_watch(user_id: int, credentials: Credentials):
+    """Start or renew the user's Gmail watch, keeping the history id we have already processed up to"""
+    response = watch_inbox(credentials=credentials, topic_name=GMAIL_PUBSUB_TOPIC)
+    expiration = datetime.fromtimestamp(int(response['expiration']) / 1000, timezone.utc).isoformat()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        existing = jobs.get_watch(cursor, user_id)
+        history_id = response['historyId'] if not existing or not existing['history_id'] else None
+        jobs.save_watch(cursor, user_id, history_id, expiration)
+        conn.commit()
+
+def renew_watches():
+    """Renew every watch that is missing or close to expiring"""
+    renew_before = (datetime.now(timezone.utc) + WATCH_RENEW_BEFORE).isoformat()
+    with get_db_connection() as conn:
+        user_ids = jobs.get_watches_expiring(conn.cursor(), renew_before)
+
+    for user_id in user_ids:
+        try:
+            credentials = get_google_credentials(user_id)
+            if credentials:
+                start_watch(user_id, credentials)
+        except Exception as e:
+            print(f"Error renewing Gmail watch for user {user_id}: {e}")
+
+def process_push_job(user_id: int, history_id: Optional[str], worker_id: Optional[str] = None):
+    """Process the mail added since the user's last seen history id, then refresh the dashboard snapshot.
+
+    With worker_id, the new history id is only saved while that worker still holds the user's lease.
+    """
+    credentials = get_google_credentials(user_id)
+    if not credentials:
+        return
+
+    with get_db_connection() as conn:
+        watch = jobs.get_watch(conn.cursor(), user_id)
+
+    if watch and watch['history_id']:
+        try:
+            new_ids = list(dict.fromkeys(iter_added_message_ids(credentials, watch['history_id'])))
+        except HttpError as e:
+            # History ids expire after about a week, the snapshot rebuild below still covers the inbox
+            print(f"Error listing Gmail history for user {user_id}: {e}")
+            new_ids = []
+
+        processed = get_processed_emails(user_id, new_ids)
+        missing_ids = [email_id for email_id in new_ids if email_id not in processed]
+        for email in fetch_email_bodies(credentials, missing_ids):
+            ai_result = analyze_email(email, user_id=user_id)
+            if ai_result and not ai_result.get('error'):
+                save_processed_email(user_id, email, ai_result)
+
+    build_dashboard(user_id, credentials)
+
+    with get_db_connection() as conn:
+        if worker_id is None:
+            jobs.save_watch(conn.cursor(), user_id, history_id)
+            conn.commit()
+        elif not jobs.save_watch_if_leased(conn, worker_id, user_id, history_id):
+            print(f"Worker {worker_id} lost its lease on user {user_id}, history id {history_id} not saved")
+
+def run_job(job: Dict):
+    process_push_job(job['user_id'], job['history_id'], job.get('worker_id'))
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+background_stop = threading.Event()
+
+def job_worker_loop():
+    jobs.run_worker(get_db_connection, run_job, new_worker_id(), background_stop, poll_seconds=JOB_POLL_SECONDS)
+
+def watch_renewal_loop():
+    while not background_stop.is_set():
+        renew_watches()
+        background_stop.wait(WATCH_RENEW_INTERVAL_SECONDS)
+
+def start_background_workers():
+    if not GMAIL_PUBSUB_TOPIC:
+        return
+    for i in range(INLINE_WORKER_THREADS):
+        threading.Thread(target=job_worker_loop, name=f"job-worker-{i}", daemon=True).start()
+    threading.Thread(target=watch_renewal_loop, name="watch-renewal", daemon=True).start()
+
+@app.post("/fetch-emails")
+@profiled("fetch_and_process_emails")
+def fetch_and_process_emails(
+    request: EmailFetchRequest,
+    response: Response,
+    current_user_id: int = Depends(verify_token),
+    if_none_match: Optional[str] = Header(None)
+):
+    try:
+        credentials = get_google_credentials(current_user_id)
+        if not credentials:
+            raise HTTPException(status_code=400, detail="Google account not connected")
+        
+        deadline = Deadline(FETCH_DEADLINE_SECONDS)
+        version, result = build_dashboard(current_user_id, credentials, request.email_count, deadline)
+        return conditional_response(response, version, result, if_none_match)
     
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Timed out listing emails: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing emails: {str(e)}")
     
 @app.post("/add-to-calendar/{email_id}")
+@profiled("add_to_calendar")
 def add_to_calendar(email_id: str, current_user_id: int = Depends(verify_token)):
     """Add event to Google Calendar"""
     try:
@@ -626,14 +1335,13 @@ def add_to_calendar(email_id: str, current_user_id: int = Depends(verify_token))
         if not credentials:
             raise HTTPException(status_code=400, detail="Google account not connected")
         
-        # Re-fetch and process emails to find the specific event
+        # Re-fetch and process emails to find the specific event, stopping once it is found
         emails = fetch_emails(credentials, 50)  # Fetch more to ensure we find the email
-        timezone = get_calendar_timezone(credentials)
         
         event_to_add = None
         for email in emails:
             if email['id'] == email_id:
-                ai_result = categorize_and_summarize_email(email['text'])
+                ai_result = categorize_and_summarize_email(email['text'], user_id=current_user_id)
                 if ai_result and ai_result['importance'] and ai_result['category'] == 'event':
                     event_to_add = ai_result['content']
                     break
@@ -641,8 +1349,11 @@ def add_to_calendar(email_id: str, current_user_id: int = Depends(verify_token))
         if not event_to_add:
             raise HTTPException(status_code=404, detail="Event not found or not processable")
         
+        timezone = get_calendar_timezone(credentials)
+        
         # Add to calendar
         calendar_event = add_cal_event(credentials, email_id, event_to_add, timezone)
+        add_linked_event(current_user_id, email_id)
         
         return {
             'message': 'Event added to calendar successfully',
@@ -666,8 +1377,12 @@ def ignore_event(email_id: str, current_user_id: int = Depends(verify_token)):
         raise HTTPException(status_code=500, detail=f"Error ignoring event: {str(e)}")
 
 @app.get("/dashboard-data")
-def get_dashboard_data(current_user_id: int = Depends(verify_token)):
-    """Get current dashboard data by re-processing emails"""
+def get_dashboard_data(
+    response: Response,
+    current_user_id: int = Depends(verify_token),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get current dashboard data, answering If-None-Match with 304 when unchanged"""
     try:
         # Get Google credentials
         credentials = get_google_credentials(current_user_id)
@@ -679,17 +1394,56 @@ def get_dashboard_data(current_user_id: int = Depends(verify_token)):
             }
         
         # Use the same logic as fetch-emails but with default count
-        request = EmailFetchRequest(email_count=10)
-        result = fetch_and_process_emails(request, current_user_id)
-        result['google_connected'] = True
+        deadline = Deadline(FETCH_DEADLINE_SECONDS)
+        version, result = build_dashboard(current_user_id, credentials, 10, deadline)
+        result = {**result, 'google_connected': True}
         
-        return result
+        return conditional_response(response, version, result, if_none_match)
     
     except HTTPException:
         raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Timed out listing emails: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error getting dashboard data: {str(e)}")
 
+@app.get("/dashboard-data/delta")
+def get_dashboard_delta(since: str, email_count: int = 10, current_user_id: int = Depends(verify_token)):
+    """Get items added or removed since a previously returned dashboard version.
+
+    A partial result comes back with no version: apply its changes, matching items by
+    email_id, and keep asking with the same since until a complete version arrives.
+    conflicts holds the current calendar conflicts of every pending event, which can
+    change without the version changing.
+    """
+    try:
+        credentials = get_google_credentials(current_user_id)
+        if not credentials:
+            raise HTTPException(status_code=400, detail="Google account not connected")
+
+        version, result = build_dashboard(current_user_id, credentials, email_count, Deadline(FETCH_DEADLINE_SECONDS))
+        partial = result['partial']
+        if version == since and not partial:
+            return {'version': version, 'full': False, 'partial': False, 'changes': diff_snapshots(result, result),
+                    'conflicts': conflicts_by_email(result)}
+
+        if partial:
+            version = None
+        previous = get_snapshot(current_user_id, since)
+        if previous is None:
+            # Unknown or expired version, the client has to replace its copy
+            return {'version': version, 'full': True, 'partial': partial, 'data': result}
+
+        return {'version': version, 'full': False, 'partial': partial, 'changes': diff_snapshots(previous, result),
+                'conflicts': conflicts_by_email(result)}
+
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Timed out listing emails: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting dashboard delta: {str(e)}")
+
 @app.get("/ignored-events")
 def get_ignored_events(current_user_id: int = Depends(verify_token)):
     """Get list of ignored events for user"""
@@ -715,6 +1469,169 @@ def remove_ignored_event(email_id: str, current_user_id: int = Depends(verify_to
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error removing ignored event: {str(e)}")
     
+@app.post("/gmail/push", status_code=204)
+def gmail_push(envelope: PushEnvelope, token: Optional[str] = None):
+    """Receive a Gmail change notification from Pub/Sub and queue processing for its user"""
+    if not PUSH_VERIFICATION_TOKEN or token != PUSH_VERIFICATION_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid push token")
+
+    try:
+        notification = json.loads(base64.b64decode(envelope.message.get('data', '')))
+        google_email = notification['emailAddress']
+        history_id = str(int(notification['historyId']))
+    except Exception as e:
+        # Acknowledge anyway, Pub/Sub would keep redelivering a payload we can never read
+        print(f"Ignoring malformed push notification: {e}")
+        return Response(status_code=204)
+
+    user_id = get_user_id_by_google_email(google_email)
+    if user_id:
+        with get_db_connection() as conn:
+            jobs.enqueue_job(conn.cursor(), user_id, 'push', history_id)
+            conn.commit()
+
+    return Response(status_code=204)
+
+@app.post("/gmail/watch")
+def start_gmail_watch(current_user_id: int = Depends(verify_token)):
+    """Start push notifications for the user's inbox"""
+    try:
+        if not GMAIL_PUBSUB_TOPIC:
+            raise HTTPException(status_code=400, detail="Push notifications are not configured")
+
+        credentials = get_google_credentials(current_user_id)
+        if not credentials:
+            raise HTTPException(status_code=400, detail="Google account not connected")
+
+        start_watch(current_user_id, credentials)
+        return {'message': 'Gmail watch started'}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error starting Gmail watch: {str(e)}")
+
+@app.get("/search")
+def search_emails(
+    q: str,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user_id: int = Depends(verify_token)
+):
+    """Full-text search over the user's stored email summaries, best matches first"""
+    def as_utc(value: Optional[datetime]) -> Optional[str]:
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+
+    try:
+        with get_db_connection() as conn:
+            page = search.search_summaries(conn.cursor(), current_user_id, q, limit, offset, as_utc(since), as_utc(until))
+        return {**page, 'limit': limit, 'offset': offset}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching emails: {str(e)}")
+
+@app.get("/stats/dedup")
+def get_dedup_stats(current_user_id: int = Depends(verify_token)):
+    """Get hit rate and Gemini calls saved by near-duplicate reuse"""
+    try:
+        counters = get_counters('dedup.')
+        lookups = counters.get('lookups', 0)
+        hits = counters.get('hits', 0)
+        return {
+            'enabled': DEDUP_ENABLED,
+            'bulk_only': DEDUP_BULK_ONLY,
+            'max_distance': min(DEDUP_MAX_DISTANCE, dedup.MAX_INDEXED_DISTANCE),
+            'lookups': lookups,
+            'hits': hits,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'llm_calls_avoided': counters.get('llm_calls_avoided', 0)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting dedup stats: {str(e)}")
+
+@app.get("/stats/speculative")
+def get_speculative_stats(current_user_id: int = Depends(verify_token)):
+    """Get how often speculative summaries were used or thrown away, per predicted category"""
+    try:
+        counters = get_counters('speculative.')
+        stats = {}
+        for category in ('event', 'general'):
+            started = counters.get(f'{category}.started', 0)
+            wasted = counters.get(f'{category}.wasted', 0)
+            stats[category] = {
+                'started': started,
+                'used': counters.get(f'{category}.used', 0),
+                'cancelled': counters.get(f'{category}.cancelled', 0),
+                'wasted_calls': wasted,
+                'waste_rate': wasted / started if started else 0.0
+            }
+        return {'enabled': SPECULATIVE_SUMMARY, 'categories': sorted(SPECULATIVE_CATEGORIES), **stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting speculative stats: {str(e)}")
+
+@app.get("/stats/models")
+def get_model_stats(since: Optional[datetime] = None, current_user_id: int = Depends(verify_token)):
+    """Get Gemini calls, escalations, re-asks, tokens and latency per stage and model for the current user"""
+    try:
+        with get_db_connection() as conn:
+            usage = routing.usage_summary(conn.cursor(), current_user_id, sqlite_timestamp(since))
+        return {'routes': MODEL_ROUTES, 'reask_limit': REASK_LIMIT, 'usage': usage}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting model stats: {str(e)}")
+
+@app.get("/admin/model-usage")
+def get_model_usage(since: Optional[datetime] = None, current_user_id: int = Depends(require_admin)):
+    """Get Gemini usage per stage and model across all users, and token totals per user"""
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            return {
+                'routes': MODEL_ROUTES,
+                'usage': routing.usage_summary(cursor, since=sqlite_timestamp(since)),
+                'users': routing.usage_by_user(cursor, sqlite_timestamp(since))
+            }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error getting model usage: {str(e)}")
+
+@app.get("/admin/profiling")
+def get_profiling_settings(current_user_id: int = Depends(require_admin)):
+    """Get the profiling switch and sampling settings"""
+    return {
+        'enabled': profiling.settings.enabled,
+        'sample_rate': profiling.settings.sample_rate,
+        'interval_ms': profiling.settings.interval_ms,
+        'max_profiles': profiling.settings.max_profiles,
+        'header': profiling.PROFILE_HEADER.decode()
+    }
+
+@app.put("/admin/profiling")
+def update_profiling_settings(update: ProfilingUpdate, current_user_id: int = Depends(require_admin)):
+    """Switch profiling on or off and change the sampling rate for this process"""
+    for field, value in update.model_dump(exclude_none=True).items():
+        setattr(profiling.settings, field, value)
+    return get_profiling_settings(current_user_id)
+
+@app.get("/admin/profiles")
+def get_profiles(current_user_id: int = Depends(require_admin)):
+    """List recent profiles, newest first"""
+    try:
+        return {'profiles': profiling.list_profiles()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error listing profiles: {str(e)}")
+
+@app.get("/admin/profiles/{name}", response_class=PlainTextResponse)
+def get_profile(name: str, current_user_id: int = Depends(require_admin)):
+    """Download a profile as folded stacks"""
+    content = profiling.read_profile(name)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return content
+
 @app.get("/user/profile")
 def get_user_profile(current_user_id: int = Depends(verify_token)):
     """Get user profile information"""
@@ -0,0 +1,81 @@
+"""Compare Google API payload sizes with and without the partial-response field masks.
+
+Runs each call the app makes for a connected user twice, once as the app sends
+it and once without `fields`, and prints response bytes and JSON parse time:
+
+    python payload_report.py <user_id> [--messages 10]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+
+from googleapiclient.discovery import build
+
+import gmail
+import google_calendar
+from main import get_google_credentials
+
+
+def measure(request):
+    """Raw response size in bytes and the time json.loads takes on it"""
+    request.postproc = lambda response, content: content
+    content = request.execute()
+    started = time.perf_counter()
+    json.loads(content)
+    return len(content), time.perf_counter() - started
+
+
+def report_row(name, full, masked):
+    (full_bytes, full_parse), (masked_bytes, masked_parse) = full, masked
+    saved = 1 - masked_bytes / full_bytes if full_bytes else 0
+    print(f"{name:<24}{full_bytes:>12,}{masked_bytes:>12,}{saved:>9.0%}{full_parse * 1000:>11.2f}{masked_parse * 1000:>11.2f}")
+    return full, masked
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Payload size report for Gmail and Calendar calls")
+    parser.add_argument('user_id', type=int)
+    parser.add_argument('--messages', type=int, default=10)
+    args = parser.parse_args()
+
+    credentials = get_google_credentials(args.user_id)
+    if not credentials:
+        raise SystemExit("Google account not connected for this user")
+
+    gmail_service = build("gmail", "v1", credentials=credentials)
+    calendar_service = build("calendar", "v3", credentials=credentials)
+    messages = gmail_service.users().messages()
+    list_args = dict(userId="me", labelIds=['INBOX'], q=gmail.inbox_query(), maxResults=args.messages)
+    message_ids = gmail.list_message_ids(credentials, args.messages)
+
+    now = datetime.now().astimezone()
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    event_args = dict(calendarId="primary", timeMin=start_of_day.isoformat(),
+                      timeMax=start_of_day.replace(hour=23, minute=59).isoformat(),
+                      maxResults=10, singleEvents=True, orderBy="startTime")
+
+    print(f"{'call':<24}{'full B':>12}{'masked B':>12}{'saved':>9}{'full ms':>11}{'masked ms':>11}")
+    rows = [
+        report_row("messages.list",
+                   measure(messages.list(**list_args)),
+                   measure(messages.list(**list_args, fields=gmail.LIST_FIELDS))),
+        report_row("calendars.get",
+                   measure(calendar_service.calendars().get(calendarId='primary')),
+                   measure(calendar_service.calendars().get(calendarId='primary', fields='timeZone'))),
+        report_row("events.list",
+                   measure(calendar_service.events().list(**event_args)),
+                   measure(calendar_service.events().list(**event_args, fields=google_calendar.EVENT_LIST_FIELDS))),
+    ]
+    for message_id in message_ids:
+        rows.append(report_row(f"messages.get {message_id[:10]}",
+                               measure(messages.get(userId="me", id=message_id, format='full')),
+                               measure(messages.get(userId="me", id=message_id, format='full', fields=gmail.MESSAGE_FIELDS))))
+
+    full_total = sum(full[0] for full, _ in rows)
+    masked_total = sum(masked[0] for _, masked in rows)
+    report_row("total", (full_total, sum(full[1] for full, _ in rows)), (masked_total, sum(masked[1] for _, masked in rows)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""Opt-in sampling profiler for production requests.
+
+Functions wrapped with @profiled are profiled when profiling is switched on and
+either the request is sampled (sample_rate) or it carries the PROFILE_HEADER.
+A background thread samples the request thread's stack, plus pool threads while
+they run tasks the request submitted through traced(), and the result is written in folded-stack format
+(`frame;frame;frame count`), which flamegraph.pl and speedscope read directly.
+Profiles go to a directory that keeps only the newest max_profiles files.
+
+When switched off the wrapper and the middleware only read one flag.
+"""
+import contextvars
+import functools
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+PROFILE_HEADER = b'x-profile-request'
+PROFILE_NAME_PATTERN = re.compile(r'^[\w.-]+\.folded$')
+
+
+@dataclass
+class ProfilingSettings:
+    enabled: bool = False
+    sample_rate: float = 0.0  # fraction of calls profiled without the header
+    interval_ms: float = 5.0
+    max_profiles: int = 50
+    directory: str = 'profiles'
+
+
+settings = ProfilingSettings()
+profile_requested = contextvars.ContextVar('profile_requested', default=False)
+active_sampler = contextvars.ContextVar('active_sampler', default=None)
+
+
+class ProfileRequestMiddleware:
+    """Marks requests that carry the profile header. Plain ASGI to stay cheap on every request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if settings.enabled and scope['type'] == 'http':
+            if any(name == PROFILE_HEADER for name, _ in scope.get('headers', [])):
+                profile_requested.set(True)
+        await self.app(scope, receive, send)
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse(frame) -> List[str]:
+    """Stack as a list of labels, outermost first"""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return labels[::-1]
+
+
+class Sampler(threading.Thread):
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="profiler-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        self.pool_threads: Dict[int, str] = {}  # pool threads running this request's tasks, by ident
+
+    def follow(self, thread_id: int, pool: str):
+        with self.lock:
+            self.pool_threads[thread_id] = pool
+
+    def unfollow(self, thread_id: int):
+        with self.lock:
+            self.pool_threads.pop(thread_id, None)
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frames = sys._current_frames()
+            request_frame = frames.get(self.thread_id)
+            if request_frame is not None:
+                self.stacks[";".join(['request'] + collapse(request_frame))] += 1
+
+            with self.lock:
+                pool_threads = list(self.pool_threads.items())
+            for thread_id, pool in pool_threads:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.stacks[";".join([pool] + collapse(frame))] += 1
+
+
+def traced(fn):
+    """fn wrapped for a shared pool, so the profile of the submitting request, if any, samples the task.
+
+    Pool threads serve every request, so only threads running a task submitted by the
+    profiled request are sampled, and only while that task runs.
+    """
+    sampler = active_sampler.get()
+    if sampler is None:
+        return fn
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        thread = threading.current_thread()
+        sampler.follow(thread.ident, thread.name.rsplit('_', 1)[0])
+        token = active_sampler.set(sampler)  # tasks this task submits are traced too
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            active_sampler.reset(token)
+            sampler.unfollow(thread.ident)
+    return run
+
+
+def save_profile(name: str, duration: float, stacks: Counter) -> str:
+    """Write folded stacks to the ring buffer directory, dropping the oldest profiles beyond max_profiles"""
+    os.makedirs(settings.directory, exist_ok=True)
+    filename = f"{int(time.time() * 1000)}_{name}_{int(duration * 1000)}ms_{uuid.uuid4().hex[:6]}.folded"
+    with open(os.path.join(settings.directory, filename), 'w') as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+    profiles = sorted(p for p in os.listdir(settings.directory) if PROFILE_NAME_PATTERN.match(p))
+    for old in profiles[:-settings.max_profiles] if settings.max_profiles > 0 else profiles:
+        try:
+            os.remove(os.path.join(settings.directory, old))
+        except FileNotFoundError:
+            pass
+    return filename
+
+
+def profiled(name: str):
+    """Profile the wrapped function when profiling is on and this call is sampled or requested"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not settings.enabled:
+                return fn(*args, **kwargs)
+            if not (profile_requested.get() or random.random() < settings.sample_rate):
+                return fn(*args, **kwargs)
+
+            sampler = Sampler(threading.get_ident(), settings.interval_ms / 1000)
+            started = time.perf_counter()
+            sampler.start()
+            token = active_sampler.set(sampler)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                active_sampler.reset(token)
+                sampler.done.set()
+                sampler.join()
+                try:
+                    save_profile(name, time.perf_counter() - started, sampler.stacks)
+                except OSError as e:
+                    print(f"Error saving profile for {name}: {e}")
+        return wrapper
+    return decorator
+
+
+def list_profiles() -> List[Dict]:
+    """Recent profiles, newest first"""
+    if not os.path.isdir(settings.directory):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(settings.directory), reverse=True):
+        if not PROFILE_NAME_PATTERN.match(filename):
+            continue
+        timestamp, rest = filename.split('_', 1)
+        function_name, duration, _ = rest.rsplit('_', 2)
+        profiles.append({
+            'name': filename,
+            'function': function_name,
+            'duration_ms': int(duration.removesuffix('ms')),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(int(timestamp) / 1000)),
+            'size': os.path.getsize(os.path.join(settings.directory, filename))
+        })
+    return profiles
+
+
+def read_profile(filename: str) -> Optional[str]:
+    if not PROFILE_NAME_PATTERN.match(filename):
+        return None
+    path = os.path.join(settings.directory, filename)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return f.read()
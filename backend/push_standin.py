@@ -0,0 +1,41 @@
+"""Local stand-in for Pub/Sub push delivery of Gmail notifications.
+
+Posts the envelope Pub/Sub would send to /gmail/push, so push mode can be
+exercised without a Google Cloud topic:
+
+    python push_standin.py user@gmail.com 123456 --token $PUSH_VERIFICATION_TOKEN
+"""
+import argparse
+import base64
+import json
+import os
+import uuid
+
+import requests
+
+
+def build_envelope(email_address: str, history_id: str) -> dict:
+    data = json.dumps({'emailAddress': email_address, 'historyId': history_id}).encode()
+    return {
+        'message': {
+            'data': base64.b64encode(data).decode(),
+            'messageId': str(uuid.uuid4()),
+        },
+        'subscription': 'projects/local/subscriptions/gmail-push-standin'
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Post a Gmail push notification to the local server")
+    parser.add_argument('email_address')
+    parser.add_argument('history_id')
+    parser.add_argument('--url', default='http://localhost:8000/gmail/push')
+    parser.add_argument('--token', default=os.getenv('PUSH_VERIFICATION_TOKEN'))
+    args = parser.parse_args()
+
+    response = requests.post(args.url, params={'token': args.token}, json=build_envelope(args.email_address, args.history_id))
+    print(response.status_code, response.text)
+
+
+if __name__ == "__main__":
+    main()
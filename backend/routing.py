@@ -0,0 +1,126 @@
+"""Per-stage Gemini model routing and token accounting.
+
+Each AI stage (categorize, event_summary, general_summary) has a chain of
+models, cheapest first. A stage calls the first model and moves on to the next
+only when the call fails or its output does not validate. Every call, re-asks
+included, is recorded in model_usage with its token counts and latency, so
+routing configs can be compared on cost and quality (see evaluate_routing.py).
+
+Chains can be overridden with a JSON file mapping stages to model lists:
+
+    {"categorize": ["gemini-2.5-flash-lite", "gemini-2.5-flash"]}
+
+Stages left out keep their default chain.
+"""
+import json
+from typing import Dict, List, Optional
+
+STAGES = ('categorize', 'event_summary', 'general_summary')
+DEFAULT_ROUTES = {
+    'categorize': ['gemini-2.5-flash-lite', 'gemini-2.5-flash'],
+    'event_summary': ['gemini-2.5-flash', 'gemini-2.5-pro'],
+    'general_summary': ['gemini-2.5-flash', 'gemini-2.5-pro'],
+}
+
+
+def load_routes(path: Optional[str] = None) -> Dict[str, List[str]]:
+    routes = {stage: list(models) for stage, models in DEFAULT_ROUTES.items()}
+    if not path:
+        return routes
+
+    with open(path) as f:
+        config = json.load(f)
+    for stage, models in config.items():
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage {stage!r} in {path}, expected one of {', '.join(STAGES)}")
+        if isinstance(models, str):
+            models = [models]
+        if not models:
+            raise ValueError(f"No models given for stage {stage!r} in {path}")
+        routes[stage] = list(models)
+    return routes
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS model_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            stage TEXT NOT NULL,
+            model TEXT NOT NULL,
+            attempt INTEGER NOT NULL,
+            reask INTEGER NOT NULL DEFAULT 0,
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms INTEGER NOT NULL,
+            outcome TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("PRAGMA table_info(model_usage)")
+    if 'reask' not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute("ALTER TABLE model_usage ADD COLUMN reask INTEGER NOT NULL DEFAULT 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_model_usage_user ON model_usage (user_id, created_at)")
+
+
+def token_counts(response) -> tuple:
+    """Prompt and output tokens of a Gemini response. Thinking tokens are billed as output, so they count too."""
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return 0, 0
+    output = (usage.candidates_token_count or 0) + (getattr(usage, 'thoughts_token_count', None) or 0)
+    return usage.prompt_token_count or 0, output
+
+
+def record_usage(cursor, user_id: Optional[int], stage: str, model: str, attempt: int, response,
+                 latency: float, outcome: str, reask: int = 0):
+    """Log one model call. outcome is 'ok', 'invalid' (output failed validation), 'error',
+    or 'unused' (a hedged or abandoned call whose response was not used).
+
+    attempt is the model's place in the stage's chain, reask how many times that model
+    had already been sent its own invalid output back.
+    """
+    prompt_tokens, output_tokens = token_counts(response)
+    cursor.execute("""
+        INSERT INTO model_usage (user_id, stage, model, attempt, reask, prompt_tokens, output_tokens, latency_ms, outcome)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, stage, model, attempt, reask, prompt_tokens, output_tokens, int(latency * 1000), outcome))
+
+
+def usage_summary(cursor, user_id: Optional[int] = None, since: Optional[str] = None) -> List[Dict]:
+    """Calls, outcomes, re-asks, tokens and latency per stage and model, for one user or everyone"""
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if since:
+        conditions.append("created_at >= ?")
+        params.append(since)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cursor.execute(f"""
+        SELECT stage, model, COUNT(*) AS calls,
+               SUM(outcome = 'ok') AS ok, SUM(outcome = 'invalid') AS invalid, SUM(outcome = 'error') AS errors,
+               SUM(outcome = 'unused') AS unused,
+               SUM(attempt > 0) AS escalated_calls,
+               SUM(reask > 0) AS reasks, SUM(reask > 0 AND outcome = 'ok') AS reasks_fixed,
+               SUM(prompt_tokens) AS prompt_tokens, SUM(output_tokens) AS output_tokens,
+               AVG(latency_ms) AS avg_latency_ms, MAX(latency_ms) AS max_latency_ms
+        FROM model_usage {where}
+        GROUP BY stage, model
+        ORDER BY stage, MIN(attempt), model
+    """, params)
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def usage_by_user(cursor, since: Optional[str] = None) -> List[Dict]:
+    """Token totals per user and stage, heaviest users first"""
+    cursor.execute("""
+        SELECT user_id, stage, COUNT(*) AS calls,
+               SUM(prompt_tokens) AS prompt_tokens, SUM(output_tokens) AS output_tokens,
+               AVG(latency_ms) AS avg_latency_ms
+        FROM model_usage
+        WHERE created_at >= COALESCE(?, '')
+        GROUP BY user_id, stage
+        ORDER BY SUM(SUM(prompt_tokens + output_tokens)) OVER (PARTITION BY user_id) DESC, user_id, stage
+    """, (since,))
+    return [dict(row) for row in cursor.fetchall()]
@@ -0,0 +1,134 @@
+"""Local full-text search over processed email summaries.
+
+Summaries are stored zlib-compressed in email_summaries. The text is indexed in
+a contentless FTS5 table keyed by the summary row id, so it is held once,
+compressed, and the index stores only terms. Searches join back to
+email_summaries for the user, date filters and the stored summary.
+
+Terms are not stemmed: the last query term is matched as a prefix, and a
+stemmer would also rewrite that partial term (pay -> pai). Prefix indexes
+keep short prefixes fast.
+"""
+import json
+import re
+import zlib
+from typing import Dict, List, Optional
+
+# bm25 column weights: sender, subject, summary
+RANK_WEIGHTS = (1.0, 2.0, 1.0)
+TERM_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def create_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS email_summaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            email_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            sender TEXT,
+            subject TEXT,
+            summary BLOB NOT NULL,
+            received_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            UNIQUE(user_id, email_id)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_summaries_received ON email_summaries (user_id, received_at)")
+
+    cursor.execute("SELECT sql FROM sqlite_master WHERE name = 'email_summaries_fts'")
+    existing = cursor.fetchone()
+    stemmed = existing is not None and 'porter' in existing[0]
+    if stemmed:
+        cursor.execute("DROP TABLE email_summaries_fts")
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS email_summaries_fts USING fts5(
+            sender, subject, summary, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+        )
+    """)
+    if stemmed:
+        rebuild_index(cursor)
+
+
+def rebuild_index(cursor):
+    """Index every stored summary again, for an index built with other settings"""
+    cursor.execute("SELECT id, sender, subject, summary FROM email_summaries")
+    for row_id, sender, subject, summary in cursor.fetchall():
+        cursor.execute("""
+            INSERT INTO email_summaries_fts (rowid, sender, subject, summary) VALUES (?, ?, ?, ?)
+        """, (row_id, sender or '', subject or '', summary_text(json.loads(zlib.decompress(summary)))))
+
+
+def summary_text(content: Dict) -> str:
+    """Searchable text of an event or general summary"""
+    fields = ('event_name', 'event_type', 'event_summary', 'email_summary')
+    return "\n".join(str(content[field]) for field in fields if content.get(field))
+
+
+def index_summary(cursor, user_id: int, email: Dict, category: str, content: Dict):
+    """Store and index a summary. Emails already indexed for the user are left as they are."""
+    cursor.execute("""
+        INSERT OR IGNORE INTO email_summaries (user_id, email_id, category, sender, subject, summary, received_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, email['id'], category, email.get('sender', ''), email.get('subject', ''),
+          zlib.compress(json.dumps(content, default=str).encode()), email.get('received_at')))
+    if cursor.rowcount == 0:
+        return
+    cursor.execute("""
+        INSERT INTO email_summaries_fts (rowid, sender, subject, summary) VALUES (?, ?, ?, ?)
+    """, (cursor.lastrowid, email.get('sender', ''), email.get('subject', ''), summary_text(content)))
+
+
+def build_match_query(query: str) -> Optional[str]:
+    """Turn free text into an FTS5 query: every term must match, the last one as a prefix"""
+    terms = TERM_PATTERN.findall(query)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += '*'
+    return " ".join(quoted)
+
+
+def search_summaries(cursor, user_id: int, query: str, limit: int = 20, offset: int = 0,
+                     since: Optional[str] = None, until: Optional[str] = None) -> Dict:
+    """Best matches first. Fetches one extra row to tell whether another page exists."""
+    match_query = build_match_query(query)
+    if not match_query:
+        return {'results': [], 'has_more': False}
+
+    filters = ["email_summaries_fts MATCH ?", "s.user_id = ?"]
+    params: List = [match_query, user_id]
+    if since:
+        filters.append("s.received_at >= ?")
+        params.append(since)
+    if until:
+        filters.append("s.received_at < ?")
+        params.append(until)
+
+    cursor.execute(f"""
+        SELECT s.email_id, s.category, s.sender, s.subject, s.summary, s.received_at,
+               bm25(email_summaries_fts, {', '.join(str(weight) for weight in RANK_WEIGHTS)}) AS rank
+        FROM email_summaries_fts
+        JOIN email_summaries s ON s.id = email_summaries_fts.rowid
+        WHERE {' AND '.join(filters)}
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    """, (*params, limit + 1, offset))
+    rows = cursor.fetchall()
+
+    return {
+        'results': [
+            {
+                'email_id': row[0],
+                'category': row[1],
+                'sender': row[2],
+                'subject': row[3],
+                'content': json.loads(zlib.decompress(row[4])),
+                'received_at': row[5],
+                'score': -row[6]
+            }
+            for row in rows[:limit]
+        ],
+        'has_more': len(rows) > limit
+    }
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# main reads these at import time, so they are set before any test module imports it
+os.environ.setdefault('GOOGLE_API_KEY', 'test')
+os.environ.setdefault('DATABASE_URL', os.path.join(tempfile.mkdtemp(), 'import.db'))
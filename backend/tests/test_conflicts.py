@@ -0,0 +1,82 @@
+import pytest
+
+import main
+
+BUSY = [
+    {'start': '2026-10-21T09:00:00+00:00', 'end': '2026-10-21T10:00:00+00:00'},
+    {'start': '2026-10-21T09:30:00+00:00', 'end': '2026-10-21T11:00:00+00:00'},
+    {'start': '2026-10-21T14:00:00+00:00', 'end': '2026-10-21T15:00:00+00:00'},
+]
+
+
+def pending_event(email_id, start, end):
+    return {'email_id': email_id, 'content': {'event_start': start, 'event_end': end}}
+
+
+@pytest.fixture
+def calendar(monkeypatch):
+    """Counts Calendar round trips; busy periods come from calendar['busy']"""
+    calls = {'timezone': 0, 'free_busy': 0, 'busy': BUSY}
+
+    def get_calendar_timezone(credentials):
+        calls['timezone'] += 1
+        return 'UTC'
+
+    def query_free_busy(credentials, start, end, timezone):
+        calls['free_busy'] += 1
+        if isinstance(calls['busy'], Exception):
+            raise calls['busy']
+        return calls['busy']
+
+    monkeypatch.setattr(main, 'get_calendar_timezone', get_calendar_timezone)
+    monkeypatch.setattr(main, 'query_free_busy', query_free_busy)
+    return calls
+
+
+def test_events_are_tagged_with_overlapping_busy_periods(calendar):
+    events = [
+        pending_event('both', '2026-10-21 09:45', '2026-10-21 10:15'),
+        pending_event('touching', '2026-10-21 11:00', '2026-10-21 14:00'),
+        pending_event('afternoon', '2026-10-21 14:30', '2026-10-21 14:45'),
+    ]
+    main.tag_conflicts(None, events, 'UTC')
+
+    assert [len(event['conflicts']) for event in events] == [2, 0, 1]
+    assert events[2]['conflicts'] == [{'start': BUSY[2]['start'], 'end': BUSY[2]['end']}]
+    assert calendar == {'timezone': 0, 'free_busy': 1, 'busy': BUSY}
+
+
+def test_failed_free_busy_call_leaves_conflicts_unknown(calendar):
+    calendar['busy'] = RuntimeError('calendar unavailable')
+    events = [pending_event('a', '2026-10-21 09:45', '2026-10-21 10:15')]
+    main.tag_conflicts(None, events, 'UTC')
+    assert events[0]['conflicts'] is None
+
+
+def test_malformed_busy_period_leaves_conflicts_unknown(calendar):
+    calendar['busy'] = [{'start': 'not a time', 'end': '2026-10-21T10:00:00+00:00'}]
+    events = [pending_event('a', '2026-10-21 09:45', '2026-10-21 10:15')]
+    main.tag_conflicts(None, events, 'UTC')
+    assert events[0]['conflicts'] is None
+
+
+def test_cached_dashboard_makes_one_calendar_call(calendar, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DATABASE_URL', str(tmp_path / 'test.db'))
+    main.init_database()
+    event = {'importance': True, 'category': 'event', 'content': {
+        'event_name': 'Dentist', 'event_type': 'Appointment', 'event_start': '2026-10-21 09:45', 'event_summary': 'Checkup'}}
+    monkeypatch.setattr(main, 'list_email_ids', lambda credentials, count: ['m1'])
+    monkeypatch.setattr(main, 'fetch_email_bodies', lambda credentials, ids: iter([{'id': 'm1', 'sender': 's', 'subject': 'x', 'text': 't'}]))
+    monkeypatch.setattr(main, 'analyze_email', lambda email, deadline=None, user_id=None: event)
+    monkeypatch.setattr(main, 'fetch_calendar', lambda credentials, day, timezone: [])
+
+    version, first = main.build_dashboard(1, None)
+    assert 'conflicts' not in main.get_snapshot(1, version)['pending_events'][0]
+
+    calendar.update(timezone=0, free_busy=0, busy=BUSY[:1])
+    cached_version, cached = main.build_dashboard(1, None)
+
+    assert cached_version == version
+    assert (calendar['timezone'], calendar['free_busy']) == (0, 1)
+    assert len(first['pending_events'][0]['conflicts']) == 2
+    assert len(cached['pending_events'][0]['conflicts']) == 1
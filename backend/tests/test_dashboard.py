@@ -0,0 +1,106 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def item(email_id, **fields):
+    return {'email_id': email_id, 'sender': 's', 'subject': email_id, 'content': {}, **fields}
+
+
+def dashboard(summarized=(), events=(), unprocessed=()):
+    return {
+        'summarized_emails': [item(email_id) for email_id in summarized],
+        'pending_events': [item(email_id, conflicts=[]) for email_id in events],
+        'total_emails_processed': len(summarized) + len(events),
+        'unprocessed_email_ids': list(unprocessed),
+        'partial': bool(unprocessed),
+    }
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """Client for user 1 whose build_dashboard returns served['version'] and served['data']"""
+    monkeypatch.setattr(main, 'DATABASE_URL', str(tmp_path / 'test.db'))
+    main.init_database()
+    state = {'version': 'v1', 'data': dashboard(summarized=['a'])}
+    monkeypatch.setattr(main, 'get_google_credentials', lambda user_id: object())
+    monkeypatch.setattr(main, 'build_dashboard', lambda *args: (state['version'], state['data']))
+    main.app.dependency_overrides[main.verify_token] = lambda: 1
+    state['client'] = TestClient(main.app)
+    yield state
+    main.app.dependency_overrides.clear()
+
+
+def test_snapshot_version_ignores_order_but_not_ignored_events():
+    version = main.compute_snapshot_version(['a', 'b'], {'x'}, set())
+    assert main.compute_snapshot_version(['b', 'a'], {'x'}, set()) == version
+    assert main.compute_snapshot_version(['a', 'b'], set(), set()) != version
+    assert main.compute_snapshot_version(['a', 'b'], set(), {'x'}) != main.compute_snapshot_version(['a', 'b'], {'x'}, set())
+
+
+def test_unchanged_dashboard_is_answered_with_304(served):
+    first = served['client'].get('/dashboard-data')
+    etag = first.headers['ETag']
+    assert first.json()['version'] == 'v1'
+
+    assert served['client'].get('/dashboard-data', headers={'If-None-Match': etag}).status_code == 304
+    assert served['client'].get('/dashboard-data', headers={'If-None-Match': f'W/{etag}'}).status_code == 304
+    assert served['client'].get('/dashboard-data', headers={'If-None-Match': f'"other", {etag}'}).status_code == 304
+
+    served['version'] = 'v2'
+    assert served['client'].get('/dashboard-data', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_etag_changes_with_calendar_conflicts(served):
+    served['data'] = dashboard(events=['e'])
+    etag = served['client'].get('/dashboard-data').headers['ETag']
+
+    served['data']['pending_events'][0]['conflicts'] = [{'start': '09:00', 'end': '10:00'}]
+    response = served['client'].get('/dashboard-data', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_partial_dashboard_has_no_version(served):
+    served['data'] = dashboard(summarized=['a'], unprocessed=['b'])
+    response = served['client'].get('/dashboard-data', headers={'If-None-Match': '*'})
+    assert response.status_code == 200
+    assert response.json()['version'] is None
+    assert 'ETag' not in response.headers
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_diff_keeps_unprocessed_emails():
+    old = dashboard(summarized=['a', 'b', 'c'])
+    new = dashboard(summarized=['a', 'd'], unprocessed=['c'])
+    changes = main.diff_snapshots(old, new)['summarized_emails']
+    assert [added['email_id'] for added in changes['added']] == ['d']
+    assert changes['removed'] == ['b']
+
+
+def test_delta_lists_removed_items(served):
+    main.save_snapshot(1, 'v1', dashboard(summarized=['a', 'b'], events=['e']))
+    served['version'], served['data'] = 'v2', dashboard(summarized=['a'], events=['e'])
+
+    delta = served['client'].get('/dashboard-data/delta', params={'since': 'v1'}).json()
+
+    assert (delta['version'], delta['full'], delta['partial']) == ('v2', False, False)
+    assert delta['changes']['summarized_emails'] == {'added': [], 'removed': ['b']}
+    assert delta['conflicts'] == {'e': []}
+
+
+def test_partial_delta_has_no_version(served):
+    main.save_snapshot(1, 'v1', dashboard(summarized=['a', 'b']))
+    served['version'], served['data'] = 'v1', dashboard(summarized=['a'], unprocessed=['b'])
+
+    delta = served['client'].get('/dashboard-data/delta', params={'since': 'v1'}).json()
+
+    assert (delta['version'], delta['partial']) == (None, True)
+    assert delta['changes']['summarized_emails']['removed'] == []
+
+
+def test_delta_from_unknown_version_is_full(served):
+    delta = served['client'].get('/dashboard-data/delta', params={'since': 'expired'}).json()
+    assert (delta['version'], delta['full']) == ('v1', True)
+    assert delta['data'] == served['data']
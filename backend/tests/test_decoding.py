@@ -0,0 +1,25 @@
+import pytest
+
+import decoding
+import main
+
+EVENT = {'event_name': 'Dentist', 'event_type': 'Appointment', 'event_start': '2026-10-21 10:00', 'event_summary': 'Checkup'}
+
+
+def test_times_are_normalized():
+    content = decoding.decode(main.EventSummary, {**EVENT, 'event_start': '2026-10-21T10:00:00+02:00'})
+    assert content['event_start'] == '2026-10-21 10:00'
+    assert content['event_end'] == '2026-10-21 11:00'
+
+
+@pytest.mark.parametrize('start', ['2026-10-21', '20261021'])
+def test_date_without_time_is_rejected(start):
+    with pytest.raises(decoding.DecodeError) as excinfo:
+        decoding.decode(main.EventSummary, {**EVENT, 'event_start': start})
+    assert 'event_start' in str(excinfo.value)
+
+
+def test_blank_event_summary_is_rejected():
+    with pytest.raises(decoding.DecodeError) as excinfo:
+        decoding.decode(main.EventSummary, {**EVENT, 'event_summary': '  '})
+    assert str(excinfo.value) == 'event_summary: must not be empty'
@@ -0,0 +1,59 @@
+import sqlite3
+
+import dedup
+
+APPOINTMENT = """Hi {name},
+
+This is a reminder of your appointment at Riverside Dental Clinic on {date} at {time}.
+Please arrive ten minutes early and bring your insurance card and a photo ID with you.
+If you need to reschedule, reply to this message or call the front desk at least one day ahead.
+We look forward to seeing you at the clinic.
+"""
+
+SHIPPING = """Your order has shipped
+
+Good news: the parcel with your order is on its way to {name}, {street}, and should arrive within three working days.
+You can follow the delivery from the orders page of your account at any time.
+If nobody is home, the courier will leave a card with instructions for picking the parcel up at a nearby location.
+Deliveries are made between eight in the morning and six in the evening, Monday to Saturday.
+You can change the delivery day or choose a safe place for the parcel from the same page.
+Returns are free within thirty days, just start a return from your account and print the label.
+Thank you for shopping with us.
+"""
+
+
+def lookup(stored_text, text, max_distance=6):
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.cursor()
+    dedup.create_tables(cursor)
+    dedup.store_fingerprint(cursor, dedup.simhash(stored_text), dedup.exact_signature(stored_text), '{}')
+    return dedup.find_near_duplicate(cursor, dedup.simhash(text), dedup.exact_signature(text), max_distance, 72)
+
+
+def test_same_mail_to_another_recipient_matches():
+    first = APPOINTMENT.format(name='Alice', date='2026-10-21', time='09:30')
+    second = APPOINTMENT.format(name='Bob', date='2026-10-21', time='09:30')
+    assert lookup(first, second) is not None
+
+
+def test_mails_differing_only_in_dates_do_not_match():
+    first = APPOINTMENT.format(name='Alice', date='2026-10-21', time='09:30')
+    second = APPOINTMENT.format(name='Alice', date='2026-11-03', time='16:00')
+    assert dedup.hamming_distance(dedup.simhash(first), dedup.simhash(second)) > 0
+    assert lookup(first, second, max_distance=dedup.MAX_INDEXED_DISTANCE) is None
+
+
+def test_mails_differing_only_in_names_and_addresses_do_not_match():
+    first = SHIPPING.format(name='Alice Johnson', street='12 Maple Street')
+    second = SHIPPING.format(name='Bob Smith', street='12 Oak Avenue')
+    assert dedup.hamming_distance(dedup.simhash(first), dedup.simhash(second)) <= dedup.MAX_INDEXED_DISTANCE
+    assert lookup(first, second, max_distance=dedup.MAX_INDEXED_DISTANCE) is None
+
+
+def test_rows_without_signature_are_not_matched():
+    text = APPOINTMENT.format(name='Alice', date='2026-10-21', time='09:30')
+    conn = sqlite3.connect(':memory:')
+    cursor = conn.cursor()
+    dedup.create_tables(cursor)
+    dedup.store_fingerprint(cursor, dedup.simhash(text), None, '{}')
+    assert dedup.find_near_duplicate(cursor, dedup.simhash(text), dedup.exact_signature(text), 6, 72) is None
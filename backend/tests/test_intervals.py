@@ -0,0 +1,20 @@
+from intervals import IntervalIndex
+
+
+def test_overlapping_intervals_are_all_found():
+    # A long interval that starts first must still be found after shorter ones have ended
+    index = IntervalIndex([(0, 100, 'long'), (10, 20, 'short'), (30, 40, 'later')])
+    assert sorted(index.overlapping(35, 36)) == ['later', 'long']
+    assert index.overlapping(50, 60) == ['long']
+    assert index.overlapping(100, 110) == []
+
+
+def test_touching_bounds_do_not_overlap():
+    index = IntervalIndex([(10, 20, 'busy')])
+    assert index.overlapping(20, 30) == []
+    assert index.overlapping(0, 10) == []
+    assert index.overlapping(19, 21) == ['busy']
+
+
+def test_empty_index():
+    assert IntervalIndex([]).overlapping(0, 10) == []
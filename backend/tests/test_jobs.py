@@ -0,0 +1,50 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import jobs
+
+
+def test_worker_survives_a_failed_finish(tmp_path, monkeypatch):
+    path = str(tmp_path / 'jobs.db')
+
+    @contextmanager
+    def connect():
+        conn = sqlite3.connect(path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    with connect() as conn:
+        jobs.create_tables(conn.cursor())
+        jobs.enqueue_job(conn.cursor(), 1, 'push', '100')
+        jobs.enqueue_job(conn.cursor(), 2, 'push', '200')
+        conn.commit()
+
+    finish_job = jobs.finish_job
+    failures = []
+
+    def flaky_finish_job(cursor, job, worker_id, error=None):
+        if not failures:
+            failures.append(job['user_id'])
+            raise sqlite3.OperationalError('database is locked')
+        finish_job(cursor, job, worker_id, error)
+
+    monkeypatch.setattr(jobs, 'finish_job', flaky_finish_job)
+    stop = threading.Event()
+    handled = []
+
+    def handle(job):
+        handled.append(job['user_id'])
+        if len(handled) == 3:
+            stop.set()
+
+    worker = threading.Thread(target=jobs.run_worker, args=(connect, handle, 'worker-1', stop),
+                              kwargs={'lease_seconds': 0.3, 'poll_seconds': 0.05})
+    worker.start()
+    worker.join(timeout=5)
+
+    assert not worker.is_alive()
+    # The unfinished job comes back once its lease expires
+    assert handled == [1, 2, 1]
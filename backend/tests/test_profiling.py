@@ -0,0 +1,31 @@
+import threading
+import time
+
+import deadline
+import profiling
+
+
+def profiled_work():
+    time.sleep(0.2)
+
+
+def other_request_work():
+    time.sleep(0.3)
+
+
+def test_profile_samples_only_pool_tasks_of_the_profiled_request(monkeypatch):
+    monkeypatch.setattr(profiling, 'settings', profiling.ProfilingSettings(enabled=True, sample_rate=1.0, interval_ms=2))
+    stacks = {}
+    monkeypatch.setattr(profiling, 'save_profile', lambda name, duration, sampled: stacks.update(sampled))
+
+    @profiling.profiled('request')
+    def request():
+        deadline.call_with_deadline(profiled_work, cap=5)
+
+    other = threading.Thread(target=deadline.call_with_deadline, args=(other_request_work,), kwargs={'cap': 5})
+    other.start()
+    request()
+    other.join()
+
+    assert any('profiled_work' in stack and stack.startswith('deadline-call;') for stack in stacks)
+    assert not any('other_request_work' in stack for stack in stacks)
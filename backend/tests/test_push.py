@@ -0,0 +1,188 @@
+import base64
+
+import pytest
+from fastapi.testclient import TestClient
+
+import gmail
+import jobs
+import main
+from push_standin import build_envelope
+
+TOKEN = 'push-secret'
+GOOGLE_EMAIL = 'user@example.com'
+
+
+class FakeRequest:
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self):
+        return self.result
+
+
+class FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        for request_id, request in self.requests:
+            self.callback(request_id, request.execute(), None)
+
+
+class FakeGmail:
+    """Enough of the Gmail discovery client for history, list and batched get"""
+
+    def __init__(self, messages, history):
+        self.messages_by_id = messages
+        self.history_records = history
+
+    def users(self):
+        return self
+
+    def history(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def list(self, **kwargs):
+        if 'startHistoryId' in kwargs:
+            return FakeRequest({'history': self.history_records})
+        return FakeRequest({'messages': [{'id': message_id} for message_id in self.messages_by_id]})
+
+    def get(self, id, **kwargs):
+        return FakeRequest(self.messages_by_id[id])
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(callback)
+
+
+def gmail_message(subject, text):
+    return {
+        'payload': {
+            'mimeType': 'text/plain',
+            'headers': [{'name': 'From', 'value': 'sender@example.com'}, {'name': 'Subject', 'value': subject}],
+            'body': {'data': base64.urlsafe_b64encode(text.encode()).decode()},
+        },
+        'internalDate': '1760000000000',
+    }
+
+
+@pytest.fixture
+def user_id(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'DATABASE_URL', str(tmp_path / 'test.db'))
+    monkeypatch.setattr(main, 'PUSH_VERIFICATION_TOKEN', TOKEN)
+    main.init_database()
+    with main.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO users (username, email, hashed_password) VALUES ('user', ?, 'x')", (GOOGLE_EMAIL,))
+        user_id = cursor.lastrowid
+        cursor.execute("""
+            INSERT INTO google_credentials (user_id, access_token, refresh_token, google_email) VALUES (?, 'a', 'r', ?)
+        """, (user_id, GOOGLE_EMAIL))
+        conn.commit()
+    return user_id
+
+
+@pytest.fixture
+def client():
+    # Not used as a context manager, so the lifespan background workers stay off
+    return TestClient(main.app)
+
+
+def pending_jobs(user_id):
+    with main.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT history_id FROM processing_jobs WHERE user_id = ? AND status = 'pending'", (user_id,))
+        return [row['history_id'] for row in cursor.fetchall()]
+
+
+def test_push_rejects_wrong_token(client, user_id):
+    response = client.post('/gmail/push', params={'token': 'wrong'}, json=build_envelope(GOOGLE_EMAIL, '100'))
+    assert response.status_code == 403
+    assert pending_jobs(user_id) == []
+
+
+def test_malformed_payload_is_acknowledged(client, user_id):
+    envelope = build_envelope(GOOGLE_EMAIL, '100')
+    envelope['message']['data'] = base64.b64encode(b'not json').decode()
+    response = client.post('/gmail/push', params={'token': TOKEN}, json=envelope)
+    assert response.status_code == 204
+    assert pending_jobs(user_id) == []
+
+
+def test_non_numeric_history_id_is_acknowledged(client, user_id):
+    response = client.post('/gmail/push', params={'token': TOKEN}, json=build_envelope(GOOGLE_EMAIL, 'latest'))
+    assert response.status_code == 204
+    assert pending_jobs(user_id) == []
+
+
+def test_unknown_address_is_ignored(client, user_id):
+    response = client.post('/gmail/push', params={'token': TOKEN}, json=build_envelope('other@example.com', '100'))
+    assert response.status_code == 204
+    assert pending_jobs(user_id) == []
+
+
+def test_notifications_merge_into_pending_job(client, user_id):
+    for history_id in ('100', '120', '110'):
+        response = client.post('/gmail/push', params={'token': TOKEN}, json=build_envelope(GOOGLE_EMAIL, history_id))
+        assert response.status_code == 204
+    assert pending_jobs(user_id) == ['120']
+
+
+def fake_push_setup(user_id, monkeypatch):
+    """Fake Gmail with one old and one new message, a watch at history 100 and a claimed job for 150"""
+    fake = FakeGmail(
+        messages={'m1': gmail_message('Old', 'old mail'), 'm2': gmail_message('New', 'new mail')},
+        history=[{'messagesAdded': [{'message': {'id': 'm2', 'labelIds': ['INBOX', 'UNREAD']}}]}],
+    )
+    monkeypatch.setattr(gmail, 'build', lambda *args, **kwargs: fake)
+    monkeypatch.setattr(main, 'get_google_credentials', lambda user_id: object())
+    analyzed = []
+
+    def analyze_email(email, deadline=None, user_id=None):
+        analyzed.append(email['id'])
+        return {'importance': True, 'category': 'general', 'content': {'email_summary': email['text']}}
+
+    monkeypatch.setattr(main, 'analyze_email', analyze_email)
+    main.save_processed_email(user_id, {'id': 'm1', 'sender': 's', 'subject': 'Old'},
+                              {'importance': False, 'category': 'general', 'content': {}})
+    with main.get_db_connection() as conn:
+        jobs.save_watch(conn.cursor(), user_id, '100')
+        jobs.enqueue_job(conn.cursor(), user_id, 'push', '150')
+        conn.commit()
+        job = jobs.claim_next_job(conn, 'worker-1')
+    return job, analyzed
+
+
+def watch_history_id(user_id):
+    with main.get_db_connection() as conn:
+        return jobs.get_watch(conn.cursor(), user_id)['history_id']
+
+
+def test_process_push_job_analyzes_only_new_mail(user_id, monkeypatch):
+    job, analyzed = fake_push_setup(user_id, monkeypatch)
+
+    main.run_job(job)
+
+    assert analyzed == ['m2']
+    assert watch_history_id(user_id) == '150'
+    assert set(main.get_processed_emails(user_id, ['m1', 'm2'])) == {'m1', 'm2'}
+
+
+def test_worker_that_lost_its_lease_keeps_newer_history_id(user_id, monkeypatch):
+    job, _ = fake_push_setup(user_id, monkeypatch)
+    # The lease expired and another worker processed the user up to a newer history id
+    with main.get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE worker_leases SET worker_id = 'worker-2' WHERE user_id = ?", (user_id,))
+        jobs.save_watch(cursor, user_id, '200')
+        conn.commit()
+
+    main.run_job(job)
+
+    assert watch_history_id(user_id) == '200'
@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import main
+import routing
+
+
+def function_call_response(name, args):
+    part = SimpleNamespace(function_call=SimpleNamespace(name=name, args=args))
+    return SimpleNamespace(
+        candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part], role='model'))],
+        usage_metadata=SimpleNamespace(prompt_token_count=100, candidates_token_count=20, thoughts_token_count=None),
+    )
+
+
+@pytest.fixture
+def fake_gemini(tmp_path, monkeypatch):
+    """A model that leaves out the summary the first time and fixes it when re-asked"""
+    monkeypatch.setattr(main, 'DATABASE_URL', str(tmp_path / 'test.db'))
+    main.init_database()
+
+    def generate_content(model, contents, config):
+        args = {'email_summary': 'Invoice due Friday'} if len(contents) > 1 else {}
+        return function_call_response('GeneralSummary', args)
+
+    monkeypatch.setattr(main, 'genai_client', SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+
+
+def usage(user_id):
+    with main.get_db_connection() as conn:
+        return routing.usage_summary(conn.cursor(), user_id)
+
+
+def test_reasks_are_counted_per_user(fake_gemini):
+    assert main.summarize_general_email('Your invoice is due Friday', user_id=1) == {'email_summary': 'Invoice due Friday'}
+    assert main.summarize_general_email('Your invoice is due Friday', user_id=1) == {'email_summary': 'Invoice due Friday'}
+
+    [row] = usage(1)
+    assert (row['calls'], row['invalid'], row['reasks'], row['reasks_fixed']) == (4, 2, 2, 2)
+    assert usage(2) == []
+
+
+def test_hedged_call_that_loses_is_recorded(fake_gemini, monkeypatch):
+    monkeypatch.setattr(main, 'HEDGE_AFTER_SECONDS', 0.05)
+    first_call = threading.Event()
+
+    def generate_content(model, contents, config):
+        if not first_call.is_set():
+            first_call.set()
+            time.sleep(0.3)  # slow enough to be hedged, then loses the race
+        return function_call_response('GeneralSummary', {'email_summary': 'Invoice due Friday'})
+
+    monkeypatch.setattr(main, 'genai_client', SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+    assert main.summarize_general_email('Your invoice is due Friday', user_id=1) == {'email_summary': 'Invoice due Friday'}
+
+    # The losing call records itself when it finishes
+    for _ in range(50):
+        if usage(1) and usage(1)[0]['calls'] == 2:
+            break
+        time.sleep(0.05)
+    [row] = usage(1)
+    assert (row['calls'], row['ok'], row['unused'], row['output_tokens']) == (2, 1, 1, 40)
+
+
+def test_reask_column_is_added_to_existing_table():
+    cursor = sqlite3.connect(':memory:').cursor()
+    cursor.execute("""
+        CREATE TABLE model_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, stage TEXT NOT NULL, model TEXT NOT NULL,
+            attempt INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL DEFAULT 0, output_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms INTEGER NOT NULL, outcome TEXT NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("INSERT INTO model_usage (user_id, stage, model, attempt, latency_ms, outcome) VALUES (1, 'categorize', 'm', 0, 5, 'ok')")
+
+    routing.create_tables(cursor)
+
+    [row] = [dict(zip([column[0] for column in cursor.description], values))
+             for values in cursor.execute("SELECT * FROM model_usage").fetchall()]
+    assert row['reask'] == 0
@@ -0,0 +1,43 @@
+import sqlite3
+
+import search
+
+
+def make_cursor():
+    cursor = sqlite3.connect(':memory:').cursor()
+    search.create_tables(cursor)
+    return cursor
+
+
+def index(cursor, email_id, subject, summary):
+    email = {'id': email_id, 'sender': 'billing@example.com', 'subject': subject, 'received_at': '2026-10-19T08:00:00+00:00'}
+    search.index_summary(cursor, 1, email, 'general', {'email_summary': summary})
+
+
+def found(cursor, query):
+    return [result['email_id'] for result in search.search_summaries(cursor, 1, query)['results']]
+
+
+def test_partial_last_term_matches_as_prefix():
+    cursor = make_cursor()
+    index(cursor, 'm1', 'Invoice', 'Your payment of 40 dollars was received.')
+    index(cursor, 'm2', 'Newsletter', 'Weekly product updates.')
+    assert found(cursor, 'pay') == ['m1']
+    assert found(cursor, 'invoice recei') == ['m1']
+    assert found(cursor, 'weekly pay') == []
+
+
+def test_stemmed_index_is_rebuilt():
+    cursor = make_cursor()
+    index(cursor, 'm1', 'Invoice', 'Your payment was received.')
+    cursor.execute("DROP TABLE email_summaries_fts")
+    cursor.execute("""
+        CREATE VIRTUAL TABLE email_summaries_fts USING fts5(
+            sender, subject, summary, content='', tokenize='porter unicode61'
+        )
+    """)
+    search.rebuild_index(cursor)
+    assert found(cursor, 'pay') == []
+
+    search.create_tables(cursor)
+    assert found(cursor, 'pay') == ['m1']
@@ -0,0 +1,45 @@
+"""Standalone processing worker.
+
+Runs push jobs from the shared job store, so processing capacity grows with the
+number of workers. Start as many as needed on the host that has DATABASE_URL on
+local disk, and set INLINE_WORKER_THREADS=0 on the web app. The SQLite store
+does not work across hosts or over network filesystems:
+
+    python worker.py --threads 4
+"""
+import argparse
+import signal
+import threading
+
+import jobs
+from main import get_db_connection, run_job, new_worker_id, JOB_POLL_SECONDS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run processing workers against the shared job store")
+    parser.add_argument('--threads', type=int, default=1, help="workers to run in this process")
+    parser.add_argument('--lease-seconds', type=float, default=jobs.LEASE_SECONDS)
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+
+    threads = [
+        threading.Thread(target=jobs.run_worker, name=f"job-worker-{i}",
+                         args=(get_db_connection, run_job, new_worker_id(), stop, args.lease_seconds, JOB_POLL_SECONDS))
+        for i in range(args.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Started {args.threads} worker(s)")
+
+    # Wake up regularly so signals are handled while the workers run
+    while not stop.wait(1):
+        pass
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -104,6 +104,12 @@ const PendingEvents = ({ events, onEventAddedToCalendar, onEventIgnored, onEvent
                 </div>
               </div>
               <p className="mt-3 text-gray-600">{event.content.event_summary}</p>
+              {event.conflicts && event.conflicts.length > 0 && (
+                <p className="mt-3 text-sm text-red-600">
+                  Conflicts with {event.conflicts.length} busy period{event.conflicts.length > 1 ? 's' : ''} in your calendar
+                  {' '}({event.conflicts.map(c => `${new Date(c.start).toLocaleTimeString()} - ${new Date(c.end).toLocaleTimeString()}`).join(', ')})
+                </p>
+              )}
             </div>
             
             <div className="flex justify-end space-x-3">
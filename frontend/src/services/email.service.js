@@ -2,6 +2,11 @@
 
 const API_BASE_URL = 'http://localhost:8000';
 
+// Last response per request, revalidated with If-None-Match. Cleared whenever the token
+// changes, so a logout and login as someone else in the same tab never reuses it.
+let etagCache = {};
+let etagCacheToken = null;
+
 /**
  * Make authenticated API request
  */
@@ -9,20 +14,38 @@ const apiRequest = async (endpoint, options = {}) => {
   const token = localStorage.getItem('token');
   
   const config = {
+    ...options,
     headers: {
       'Content-Type': 'application/json',
       ...options.headers,
     },
-    ...options,
   };
 
   if (token) {
     config.headers.Authorization = `Bearer ${token}`;
   }
 
+  if (token !== etagCacheToken) {
+    etagCache = {};
+    etagCacheToken = token;
+  }
+  const cacheKey = `${config.method || 'GET'} ${endpoint} ${config.body || ''}`;
+  const cached = etagCache[cacheKey];
+  if (cached) {
+    config.headers['If-None-Match'] = cached.etag;
+  }
+
   const response = await fetch(`${API_BASE_URL}${endpoint}`, config);
+  if (response.status === 304 && cached) {
+    return cached.data;
+  }
   const data = await response.json();
 
+  const etag = response.headers.get('ETag');
+  if (response.ok && etag) {
+    etagCache[cacheKey] = { etag, data };
+  }
+
   if (!response.ok) {
     if (response.status === 401) {
       localStorage.removeItem('token');